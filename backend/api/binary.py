@@ -0,0 +1,43 @@
+import msgpack
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+async def _msgpack_as_json(request: Request) -> Request:
+    """
+    Decodes a MessagePack body and hands it on as an already-parsed JSON
+    request, so the usual body validation applies unchanged. Map keys must
+    be strings, as in JSON; an integer box number is a decode error.
+    """
+    body = await request.body()
+    try:
+        content = msgpack.unpackb(body, raw=False, strict_map_key=True)
+    except (ValueError, TypeError) as exc:
+        raise RequestValidationError(
+            [{"type": "msgpack_invalid", "loc": ("body",), "msg": "MessagePack decode error", "input": {}, "ctx": {"error": str(exc)}}]
+        )
+    headers = [(name, value) for name, value in request.scope["headers"] if name != b"content-type"]
+    headers.append((b"content-type", b"application/json"))
+    decoded = Request(dict(request.scope, headers=headers), request.receive)
+    decoded._body = body
+    decoded._json = content
+    return decoded
+
+class MsgPackRoute(APIRoute):
+    """
+    Route that also accepts request bodies encoded as MessagePack, for bulk
+    clients that would rather not build and parse JSON.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request):
+            content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type in MSGPACK_MEDIA_TYPES:
+                request = await _msgpack_as_json(request)
+            return await handler(request)
+
+        return route_handler
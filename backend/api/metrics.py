@@ -0,0 +1,42 @@
+import time
+
+from engine.metrics import METRICS
+
+REQUESTS = METRICS.counter(
+    "taxsimple_http_requests_total", "HTTP requests handled", ("method", "route", "status")
+)
+REQUEST_SECONDS = METRICS.histogram(
+    "taxsimple_http_request_seconds", "Time to the end of the response body, per route", ("method", "route")
+)
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware counting requests by route template and status and
+    timing them through the last byte of the response, streamed bodies
+    included. A plain ASGI class rather than BaseHTTPMiddleware so duplex
+    streaming endpoints keep reading the request body.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS.inc(labels=(scope["method"], route, str(status)))
+            REQUEST_SECONDS.observe(time.perf_counter() - start, (scope["method"], route))
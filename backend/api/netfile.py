@@ -1,48 +1,114 @@
-import uuid
-import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from xml.sax.saxutils import escape
+import re
 
-class NetfileService:
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SOFTWARE_ID = "TAXSIMPLE-2025"
+
+# Characters XML 1.0 can't carry at all, escaped or not
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+# Any character that needs escaping or removing
+_SPECIAL_XML_CHARS = re.compile("[&<>\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+def xml_text(value: Any) -> str:
     """
-    Handles CRA NETFILE generation and mock submission
+    Escapes a value for use as element text.
     """
-    
-    def generate_xml(self, calculation_result, profile):
-        """
-        Mock generation of the .tax file XML equivalent.
-        """
-        xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-<T1Return>
-    <SoftwareID>TAXSIMPLE-2025</SoftwareID>
+    text = value if isinstance(value, str) else str(value)
+    if _SPECIAL_XML_CHARS.search(text) is None:
+        return text
+    return escape(_INVALID_XML_CHARS.sub("", text))
+
+def render_return(calculation_result: Dict, profile: Dict) -> str:
+    """
+    One <T1Return> element, values escaped.
+    """
+    get = calculation_result.get
+    return f"""<T1Return>
+    <SoftwareID>{SOFTWARE_ID}</SoftwareID>
     <Taxpayer>
-        <SIN>{profile.get('sin', 'XXX-XXX-XXX')}</SIN>
-        <FirstName>{profile.get('first_name', 'GivenName')}</FirstName>
-        <LastName>{profile.get('last_name', 'Surname')}</LastName>
+        <SIN>{xml_text(profile.get('sin', 'XXX-XXX-XXX'))}</SIN>
+        <FirstName>{xml_text(profile.get('first_name', 'GivenName'))}</FirstName>
+        <LastName>{xml_text(profile.get('last_name', 'Surname'))}</LastName>
     </Taxpayer>
     <Summary>
-        <TotalIncome>{calculation_result.get('total_income', 0):.2f}</TotalIncome>
-        <NetIncome>{calculation_result.get('net_income', 0):.2f}</NetIncome>
-        <TaxableIncome>{calculation_result.get('taxable_income', 0):.2f}</TaxableIncome>
-        <RefundOrBalance>{calculation_result.get('refund_or_balance', 0):.2f}</RefundOrBalance>
+        <TotalIncome>{get('total_income') or 0:.2f}</TotalIncome>
+        <NetIncome>{get('net_income') or 0:.2f}</NetIncome>
+        <TaxableIncome>{get('taxable_income') or 0:.2f}</TaxableIncome>
+        <RefundOrBalance>{get('refund_or_balance') or 0:.2f}</RefundOrBalance>
     </Summary>
 </T1Return>
 """
-        return xml
 
-    def submit(self, calculation_result, profile):
+class T1XmlWriter:
+    """
+    Writes T1 returns as XML through `write` (a file's write method, or any
+    callable taking str) one return at a time, so a batch of any size is
+    never held in memory. With `batch`, the returns are wrapped in one
+    <T1ReturnBatch> document; otherwise a single <T1Return> is expected.
+    """
+
+    def __init__(self, write: Callable[[str], Any], batch: bool = False):
+        self.write = write
+        self.batch = batch
+        self.count = 0
+
+    def start(self):
+        self.write(XML_DECLARATION)
+        if self.batch:
+            self.write("<T1ReturnBatch>\n")
+
+    def write_return(self, calculation_result: Dict, profile: Dict):
+        self.write(render_return(calculation_result, profile))
+        self.count += 1
+
+    def write_rejected(self, line: Optional[int], message: str):
+        """
+        Records, in place of a return, an input that couldn't be calculated.
+        """
+        attributes = f' line="{int(line)}"' if line is not None else ""
+        self.write(f"<RejectedReturn{attributes}>{xml_text(message)}</RejectedReturn>\n")
+
+    def close(self):
+        if self.batch:
+            self.write("</T1ReturnBatch>\n")
+
+def iter_batch_xml(returns: Iterable[Tuple[Dict, Dict]]) -> Iterator[str]:
+    """
+    Yields a <T1ReturnBatch> document in chunks, one per (calculation
+    result, profile) pair, pulling from `returns` lazily.
+    """
+    chunks = []
+    writer = T1XmlWriter(chunks.append, batch=True)
+    writer.start()
+    for calculation_result, profile in returns:
+        writer.write_return(calculation_result, profile)
+        yield "".join(chunks)
+        chunks.clear()
+    writer.close()
+    yield "".join(chunks)
+
+class NetfileService:
+    """
+    Handles CRA NETFILE generation. Submission goes through the
+    SubmissionQueue in api.submissions.
+    """
+
+    def generate_xml(self, calculation_result, profile):
+        """
+        Mock generation of the .tax file XML equivalent.
+        """
+        return XML_DECLARATION + render_return(calculation_result, profile)
+
+    def write_batch_xml(self, returns: Iterable[Tuple[Dict, Dict]], fileobj) -> int:
         """
-        Mock submission endpoint matching PRD specs.
+        Writes (calculation result, profile) pairs to a text file as one
+        batch document. Returns the number of returns written.
         """
-        xml_payload = self.generate_xml(calculation_result, profile)
-        
-        # In a real app, this performs mutual TLS to https://netfile.cra-arc.gc.ca/netfile/2025/submit
-        
-        # Simulate success
-        confirmation_code = str(uuid.uuid4()).upper()[:16]
-        
-        return {
-            "status": "SUCCESS",
-            "message": "Return successfully transmitted to the Canada Revenue Agency.",
-            "confirmation_number": confirmation_code,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "xml_preview": xml_payload
-        }
+        writer = T1XmlWriter(fileobj.write, batch=True)
+        writer.start()
+        for calculation_result, profile in returns:
+            writer.write_return(calculation_result, profile)
+        writer.close()
+        return writer.count
@@ -0,0 +1,41 @@
+"""
+Local stand-in for the CRA NETFILE endpoint, for development and tests:
+
+    uvicorn api.netfile_standin:app --port 8900
+
+Accepts a T1 XML body, answers with a confirmation number and replays the
+same confirmation for a repeated Idempotency-Key. Set
+NETFILE_STANDIN_FAILURE_RATE (0-1) to answer that share of requests with
+503 and exercise the submission retries.
+"""
+import datetime
+import os
+import random
+import uuid
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from typing import Optional
+
+app = FastAPI(title="NETFILE stand-in")
+
+FAILURE_RATE = float(os.environ.get("NETFILE_STANDIN_FAILURE_RATE", "0"))
+_confirmations = {}
+
+@app.post("/submit")
+async def submit(request: Request, idempotency_key: Optional[str] = Header(None)):
+    if idempotency_key is not None and idempotency_key in _confirmations:
+        return _confirmations[idempotency_key]
+    if random.random() < FAILURE_RATE:
+        raise HTTPException(status_code=503, detail="NETFILE is unavailable", headers={"Retry-After": "1"})
+    body = await request.body()
+    if not body.lstrip().startswith(b"<?xml"):
+        raise HTTPException(status_code=400, detail="Expected a T1 XML document")
+    confirmation = {
+        "status": "SUCCESS",
+        "message": "Return successfully transmitted to the Canada Revenue Agency.",
+        "confirmation_number": str(uuid.uuid4()).upper()[:16],
+        "timestamp": datetime.datetime.now().isoformat(),
+    }
+    if idempotency_key is not None:
+        _confirmations[idempotency_key] = confirmation
+    return confirmation
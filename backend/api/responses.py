@@ -0,0 +1,31 @@
+from typing import Any
+import time
+
+import orjson
+from fastapi.responses import JSONResponse
+
+from engine.metrics import METRICS
+from engine.slips import encode_slip
+
+SERIALIZATION_SECONDS = METRICS.histogram(
+    "taxsimple_serialization_seconds", "Time spent encoding JSON response bodies"
+)
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson. Return it directly from a handler to
+    also skip FastAPI's jsonable_encoder pass over the content.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        body = orjson.dumps(content, default=encode_slip, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        SERIALIZATION_SECONDS.observe(time.perf_counter() - start)
+        return body
+
+def dumps_line(content: Any) -> bytes:
+    """
+    One NDJSON line, newline included.
+    """
+    return orjson.dumps(content, default=encode_slip, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
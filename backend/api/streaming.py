@@ -0,0 +1,54 @@
+from typing import AsyncIterable, AsyncIterator, Tuple
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+# Longest NDJSON line accepted before the rest of the stream is abandoned
+MAX_LINE_BYTES = 8 * 1024 * 1024
+
+class LineTooLongError(ValueError):
+    pass
+
+async def iter_ndjson_lines(chunks: AsyncIterable[bytes], max_line_bytes: int = MAX_LINE_BYTES) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Splits a streamed request body into (line number, line) pairs, skipping
+    blank lines. Only the current partial line is buffered, so memory stays
+    bounded however long the body is, and the next chunk is only pulled from
+    the client once the caller asks for more lines.
+    """
+    buffer = b""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line_number += 1
+            line = buffer[start:end].strip()
+            start = end + 1
+            if line:
+                yield line_number, line
+        buffer = buffer[start:]
+        if len(buffer) > max_line_bytes:
+            raise LineTooLongError(f"Line {line_number + 1} exceeds {max_line_bytes} bytes")
+    line = buffer.strip()
+    if line:
+        yield line_number + 1, line
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse whose body generator may still be reading the
+    request body. Starlette's version listens for disconnects on `receive`
+    while streaming, which would swallow the body chunks; here a disconnect
+    surfaces through request.stream() instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,306 @@
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying; any other 4xx means the submission itself was rejected
+RETRY_STATUSES = frozenset({408, 409, 425, 429})
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS submissions ("
+    "job_id TEXT PRIMARY KEY, idempotency_key TEXT NOT NULL, status TEXT NOT NULL, "
+    "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL, payload TEXT, "
+    "response TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+)
+
+def scoped_key(profile: Dict[str, Any], idempotency_key: str) -> str:
+    """
+    A client-supplied Idempotency-Key scoped to the taxpayer, so two
+    taxpayers' clients picking the same key never share a job.
+    """
+    scope = json.dumps([str(profile.get("sin") or ""), idempotency_key], separators=(",", ":"))
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest()
+
+class SubmissionStore:
+    """
+    Durable NETFILE submission jobs in a SQLite file. A worker claims a job
+    by pushing its next_attempt_at out by a lease, so a job whose worker
+    died mid-send is picked up again once the lease runs out, by any
+    process sharing the file.
+
+    Statuses: queued -> sending -> accepted | failed (sending falls back to
+    queued while retries remain). A failed job doesn't hold its idempotency
+    key: submitting the return again queues a new job.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            self._migrate(conn)
+            conn.execute(SCHEMA)
+            # At most one job per key that is still queued, sending or accepted
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS submissions_live_key ON submissions (idempotency_key) "
+                "WHERE status != 'failed'"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS submissions_due ON submissions (status, next_attempt_at)")
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        # Files from before failed jobs released their key have a UNIQUE column
+        row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'submissions'").fetchone()
+        if row is None or "UNIQUE" not in row[0]:
+            return
+        conn.execute("ALTER TABLE submissions RENAME TO submissions_old")
+        conn.execute(SCHEMA)
+        conn.execute("INSERT INTO submissions SELECT * FROM submissions_old")
+        conn.execute("DROP TABLE submissions_old")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _job(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["job_id"],
+            "idempotency_key": row["idempotency_key"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "response": json.loads(row["response"]) if row["response"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def enqueue(self, idempotency_key: str, payload: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queues a submission unless a job with the same idempotency key is
+        queued, sending or accepted. Returns the job and whether it was
+        created by this call.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO submissions (job_id, idempotency_key, status, attempts, next_attempt_at, "
+                "payload, created_at, updated_at) VALUES (?, ?, 'queued', 0, ?, ?, ?, ?)",
+                (job_id, idempotency_key, now, payload, now, now),
+            )
+        job = self.find(idempotency_key)
+        return job, job["job_id"] == job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM submissions WHERE job_id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def find(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        """
+        The live job for a key, or else its most recent failed one.
+        """
+        row = self._connection().execute(
+            "SELECT * FROM submissions WHERE idempotency_key = ? "
+            "ORDER BY status = 'failed', created_at DESC LIMIT 1",
+            (idempotency_key,),
+        ).fetchone()
+        return self._job(row) if row is not None else None
+
+    def claim(self, lease: float) -> Optional[Dict[str, Any]]:
+        """
+        Takes the most overdue job for sending, counting the attempt.
+        Returns its id, key, attempt number and payload.
+        """
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute(
+                "UPDATE submissions SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?, updated_at = ? "
+                "WHERE job_id = (SELECT job_id FROM submissions WHERE status IN ('queued', 'sending') "
+                "AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT 1) "
+                "RETURNING job_id, idempotency_key, attempts, payload",
+                (now + lease, now, now),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def complete(self, job_id: str, response: Any):
+        # The payload (SIN included) is dropped once the CRA has it
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE submissions SET status = 'accepted', response = ?, error = NULL, payload = NULL, "
+                "next_attempt_at = NULL, updated_at = ? WHERE job_id = ?",
+                (json.dumps(response), time.time(), job_id),
+            )
+
+    def retry(self, job_id: str, error: str, delay: float):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE submissions SET status = 'queued', error = ?, next_attempt_at = ?, updated_at = ? WHERE job_id = ?",
+                (error, now + delay, now, job_id),
+            )
+
+    def fail(self, job_id: str, error: str):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE submissions SET status = 'failed', error = ?, next_attempt_at = NULL, updated_at = ? WHERE job_id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) FROM submissions GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+class SubmissionQueue:
+    """
+    Sends queued submissions to the NETFILE endpoint from `workers` asyncio
+    tasks sharing one keep-alive connection pool. Every attempt carries the
+    job's Idempotency-Key so the endpoint can drop duplicate sends. Network
+    errors, 5xx and throttling responses are retried with jittered
+    exponential backoff (or the server's Retry-After) up to `max_attempts`;
+    other 4xx responses fail the job.
+    """
+
+    def __init__(self, store: SubmissionStore, endpoint: str, workers: int = 4, max_attempts: int = 8,
+                 backoff_base: float = 1.0, backoff_max: float = 300.0, timeout: float = 30.0,
+                 lease: float = 120.0, poll_interval: float = 1.0, transport: httpx.AsyncBaseTransport = None):
+        self.store = store
+        self.endpoint = endpoint
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        # Must outlast a send, or another worker may claim the job meanwhile
+        self.lease = max(lease, timeout * 2)
+        self.poll_interval = poll_interval
+        # Custom httpx transport, e.g. a proxy mount or httpx.MockTransport
+        self.transport = transport
+        self.sent = 0
+        self.retried = 0
+        self._client = None
+        self._wakeup = None
+        self._tasks = []
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers),
+            transport=self.transport,
+        )
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # Jobs cut off mid-send are sent again when their lease runs out
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def submit(self, idempotency_key: str, payload: str) -> Tuple[Dict[str, Any], bool]:
+        job, created = await asyncio.to_thread(self.store.enqueue, idempotency_key, payload)
+        if created and self._wakeup is not None:
+            self._wakeup.set()
+        return job, created
+
+    async def find(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.find, idempotency_key)
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim, self.lease)
+            except sqlite3.Error:
+                # Database busy; the job stays due for the next poll
+                job = None
+            if job is None:
+                # Woken by a new job, or polling for retries that fell due
+                # and jobs queued by other processes
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            try:
+                try:
+                    await self._send(job)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    await self._retry(job, f"{type(exc).__name__}: {exc}")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Couldn't record the outcome, e.g. the database is locked. The
+                # worker carries on and the job is claimed again once its lease
+                # runs out.
+                logger.exception("Could not record the outcome of submission %s", job["job_id"])
+
+    async def _send(self, job: Dict[str, Any]):
+        self.sent += 1
+        try:
+            response = await self._client.post(
+                self.endpoint,
+                content=job["payload"].encode("utf-8"),
+                headers={"Content-Type": "application/xml", "Idempotency-Key": job["idempotency_key"]},
+            )
+        except httpx.HTTPError as exc:
+            await self._retry(job, f"{type(exc).__name__}: {exc}")
+            return
+        if response.is_success:
+            try:
+                body = response.json()
+            except ValueError:
+                body = {"body": response.text}
+            await asyncio.to_thread(self.store.complete, job["job_id"], body)
+        elif response.status_code >= 500 or response.status_code in RETRY_STATUSES:
+            await self._retry(job, f"HTTP {response.status_code}", _retry_after(response))
+        else:
+            await asyncio.to_thread(self.store.fail, job["job_id"], f"HTTP {response.status_code}: {response.text[:500]}")
+
+    async def _retry(self, job: Dict[str, Any], error: str, retry_after: Optional[float] = None):
+        if job["attempts"] >= self.max_attempts:
+            await asyncio.to_thread(self.store.fail, job["job_id"], f"{error} (gave up after {job['attempts']} attempts)")
+            return
+        self.retried += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (job["attempts"] - 1)) * random.uniform(0.5, 1.0)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        await asyncio.to_thread(self.store.retry, job["job_id"], error, delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "workers": len(self._tasks),
+            "jobs": self.store.counts(),
+            "sent": self.sent,
+            "retried": self.retried,
+        }
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,66 @@
+"""
+Backend benchmark suite.
+
+    python -m benchmarks                          # run and print the table
+    python -m benchmarks --save-baseline          # record a baseline
+    python -m benchmarks --check                  # exit 1 on regressions
+
+Run from backend/. Baselines are machine-specific: record one on the
+machine that runs --check.
+"""
+from contextlib import ExitStack
+import argparse
+import os
+import sys
+
+from benchmarks.harness import compare, format_table, load_baseline, run_benchmark, save_baseline
+from benchmarks.suite import api_benchmarks, engine_benchmarks
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every case's call count")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per case; the fastest is kept")
+    parser.add_argument("--no-api", action="store_true", help="Skip the endpoint benchmarks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--check", action="store_true", help="Fail on regressions against --baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed throughput drop / p99 and peak memory rise (default 0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline) if os.path.exists(args.baseline) else {}
+    if args.check and not baseline:
+        parser.error(f"no baseline at {args.baseline}; record one with --save-baseline")
+
+    results = {}
+    with ExitStack() as stack:
+        benchmarks = engine_benchmarks(args.scale)
+        if not args.no_api:
+            benchmarks += api_benchmarks(stack, args.scale)
+        for benchmark in benchmarks:
+            if args.filter in benchmark.name:
+                results[benchmark.name] = run_benchmark(benchmark, repeat=args.repeat)
+                print(f"  {benchmark.name}: {results[benchmark.name]['throughput']:,.0f}/s", file=sys.stderr)
+
+    print(format_table(results, baseline))
+
+    if args.save_baseline:
+        # Merge so a filtered run only replaces the cases it ran
+        save_baseline(args.baseline, dict(baseline, **results))
+        print(f"\nBaseline saved to {args.baseline}")
+    if args.check:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Seeded generator of synthetic but realistic returns for benchmarks. The
+same seed always gives the same returns.
+"""
+from typing import Dict, List, Tuple
+import random
+
+PROVINCES = ["ON", "QC", "BC", "AB", "MB", "SK", "NS", "NB", "NL", "PE"]
+MARITAL_STATUSES = ["Single", "Married", "Common-law", "Divorced", "Widowed"]
+FIRST_NAMES = ["Olivia", "Liam", "Emma", "Noah", "Chloé", "Félix", "Amelia", "Lucas", "Aanya", "Wei"]
+LAST_NAMES = ["Tremblay", "Gagnon", "Roy", "Smith", "Brown", "Wilson", "Martin", "Nguyen", "Singh", "O'Neil"]
+
+# Relative frequency of each slip type on a mixed return
+SLIP_WEIGHTS = {"T4": 30, "T4A": 10, "T5": 20, "T2125": 5, "RRSP": 10, "Medical": 15, "Donation": 10}
+
+# Named return shapes: (minimum slips, maximum slips)
+SHAPES = {
+    "single_t4": (1, 1),
+    "typical": (3, 12),
+    "heavy": (150, 400),
+}
+
+def generate_profile(rng: random.Random) -> Dict:
+    age = rng.randint(19, 88)
+    return {
+        "first_name": rng.choice(FIRST_NAMES),
+        "last_name": rng.choice(LAST_NAMES),
+        "sin": "".join(str(rng.randint(0, 9)) for _ in range(9)),
+        "province": rng.choice(PROVINCES),
+        "marital_status": rng.choice(MARITAL_STATUSES),
+        "age": age,
+        "rrsp_limit": round(rng.uniform(5000, 32000), 2),
+        "available_cash": round(rng.uniform(0, 40000), 2),
+        "hbp_balance": round(rng.uniform(0, 20000), 2) if rng.random() < 0.1 else 0,
+    }
+
+def generate_slip(rng: random.Random, slip_type: str, index: int) -> Dict:
+    slip = {"id": f"slip-{index}", "type": slip_type}
+    if slip_type == "T4":
+        income = round(rng.lognormvariate(10.8, 0.5), 2)
+        slip["boxes"] = {
+            "14": income,
+            "16": round(min(income * 0.0595, 3867.50), 2),
+            "18": round(min(income * 0.0166, 1049.12), 2),
+            "22": round(income * rng.uniform(0.12, 0.28), 2),
+            "10": rng.choice(["ON", "QC", "BC", "AB"]),
+        }
+    elif slip_type == "T4A":
+        slip["boxes"] = {
+            "16": round(rng.uniform(0, 30000), 2) if rng.random() < 0.4 else 0,
+            "22": round(rng.uniform(0, 3000), 2),
+            "28": round(rng.uniform(0, 8000), 2),
+        }
+    elif slip_type == "T5":
+        slip["boxes"] = {"24": round(rng.expovariate(1 / 1500), 2)}
+    elif slip_type == "T2125":
+        slip["netIncome"] = round(rng.uniform(-5000, 90000), 2)
+        slip["businessName"] = f"{rng.choice(LAST_NAMES)} Consulting"
+    else:
+        # RRSP, Medical and Donation receipts
+        scale = {"RRSP": 4000, "Medical": 600, "Donation": 250}[slip_type]
+        slip["amount"] = round(rng.expovariate(1 / scale), 2)
+    return slip
+
+def generate_return(rng: random.Random, slip_count: int) -> Tuple[Dict, List[Dict]]:
+    """
+    One (profile, slips) return. A single-slip return is always a T4.
+    """
+    if slip_count == 1:
+        return generate_profile(rng), [generate_slip(rng, "T4", 0)]
+    types = rng.choices(list(SLIP_WEIGHTS), weights=list(SLIP_WEIGHTS.values()), k=slip_count)
+    # Every return has at least one source of employment income
+    types[0] = "T4"
+    return generate_profile(rng), [generate_slip(rng, slip_type, i) for i, slip_type in enumerate(types)]
+
+def generate_returns(count: int, shape: str = "typical", seed: int = 0) -> List[Tuple[Dict, List[Dict]]]:
+    low, high = SHAPES[shape]
+    rng = random.Random(f"{shape}:{seed}")
+    return [generate_return(rng, rng.randint(low, high)) for _ in range(count)]
@@ -0,0 +1,119 @@
+from typing import Any, Callable, Dict, List, Sequence
+import gc
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+class Benchmark:
+    """
+    `func(item)` timed once per item of `inputs`. `units` is how many
+    returns one call handles, so batch cases report returns per second.
+    `reset`, if given, runs before each pass over the inputs, e.g. to clear
+    a cache the warm-up filled.
+    """
+    __slots__ = ("name", "func", "inputs", "units", "reset")
+
+    def __init__(self, name: str, func: Callable[[Any], Any], inputs: Sequence, units: int = 1, reset: Callable = None):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.units = units
+        self.reset = reset
+
+def _percentile(ordered: List[float], q: float) -> float:
+    # Nearest-rank percentile of an already sorted list
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def run_benchmark(benchmark: Benchmark, repeat: int = 3, warmup: int = 5, memory_calls: int = 20) -> Dict[str, Any]:
+    """
+    Times every call in `repeat` passes and reports the fastest pass, which
+    is the least disturbed by the rest of the machine. A few calls are then
+    repeated under tracemalloc for the peak memory, so tracing doesn't skew
+    the latencies.
+    """
+    func, inputs = benchmark.func, benchmark.inputs
+    reset = benchmark.reset or (lambda: None)
+    reset()
+    for item in inputs[:warmup]:
+        func(item)
+
+    best = None
+    for _ in range(repeat):
+        reset()
+        gc.collect()
+        latencies = []
+        started = time.perf_counter()
+        for item in inputs:
+            start = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter() - start)
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best[0]:
+            best = (elapsed, latencies)
+    elapsed, latencies = best
+
+    reset()
+    gc.collect()
+    tracemalloc.start()
+    for item in inputs[:memory_calls]:
+        func(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "throughput": len(latencies) * benchmark.units / elapsed,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float, min_peak_kib: float = 64.0) -> List[str]:
+    """
+    Regressions of `results` against `baseline`: throughput down, or p99
+    latency or peak memory up, by more than `threshold` (0.2 = 20%). Peak
+    memory growth below `min_peak_kib` is ignored as noise.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {result['throughput']:,.0f}/s vs baseline {base['throughput']:,.0f}/s")
+        if result["p99_ms"] > base["p99_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p99 {result['p99_ms']:.3f} ms vs baseline {base['p99_ms']:.3f} ms")
+        if result["peak_kib"] > base["peak_kib"] * (1 + threshold) and result["peak_kib"] - base["peak_kib"] > min_peak_kib:
+            regressions.append(f"{name}: peak memory {result['peak_kib']:,.0f} KiB vs baseline {base['peak_kib']:,.0f} KiB")
+    return regressions
+
+def load_baseline(path: str) -> Dict[str, Dict]:
+    with open(path) as f:
+        return json.load(f)["results"]
+
+def save_baseline(path: str, results: Dict[str, Dict]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            # Baselines only compare meaningfully on the machine that made them
+            "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def format_table(results: Dict[str, Dict], baseline: Dict[str, Dict] = None) -> str:
+    lines = [f"{'benchmark':<34} {'returns/s':>12} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>10} {'vs base':>8}"]
+    for name, result in results.items():
+        change = ""
+        base = (baseline or {}).get(name)
+        if base:
+            change = f"{result['throughput'] / base['throughput'] - 1:+.0%}"
+        lines.append(
+            f"{name:<34} {result['throughput']:>12,.0f} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+            f"{result['peak_kib']:>10,.0f} {change:>8}"
+        )
+    return "\n".join(lines)
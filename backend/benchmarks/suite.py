@@ -0,0 +1,105 @@
+from contextlib import ExitStack
+from typing import List
+import json
+import os
+import tempfile
+
+from benchmarks.generator import generate_returns
+from benchmarks.harness import Benchmark
+from engine.dag import TaxCalculationEngine
+from engine.optimizer import OptimizationEngine
+from api.netfile import NetfileService
+
+TAX_YEAR = 2024
+BATCH_SIZE = 500
+
+def _scaled(count: int, scale: float) -> int:
+    return max(10, int(count * scale))
+
+def engine_benchmarks(scale: float) -> List[Benchmark]:
+    # No result cache: every call computes
+    engine = TaxCalculationEngine()
+    optimizer = OptimizationEngine()
+    netfile = NetfileService()
+    benchmarks = []
+    for shape, count in (("single_t4", 3000), ("typical", 2000), ("heavy", 200)):
+        returns = generate_returns(_scaled(count, scale), shape)
+        benchmarks.append(Benchmark(
+            f"engine.calculate[{shape}]", lambda item: engine.calculate(TAX_YEAR, *item), returns
+        ))
+
+    returns = generate_returns(_scaled(20, scale) * BATCH_SIZE, "typical", seed=1)
+    batches = [returns[i:i + BATCH_SIZE] for i in range(0, len(returns), BATCH_SIZE)]
+    benchmarks.append(Benchmark(
+        f"engine.calculate_batch[{BATCH_SIZE}]", lambda batch: engine.calculate_batch(TAX_YEAR, batch), batches,
+        units=BATCH_SIZE,
+    ))
+
+    returns = generate_returns(_scaled(500, scale), "typical", seed=2)
+    analyzed = [(engine.calculate(TAX_YEAR, profile, slips), profile, slips) for profile, slips in returns]
+    benchmarks.append(Benchmark(
+        "optimizer.analyze[typical]",
+        lambda item: optimizer.analyze(item[0], TAX_YEAR, item[1], item[2]),
+        analyzed,
+    ))
+    # Consecutive returns paired up as spouses
+    couples = [(analyzed[i], analyzed[i + 1]) for i in range(0, len(analyzed) - 1, 2)]
+    benchmarks.append(Benchmark(
+        "optimizer.analyze[household]",
+        lambda couple: optimizer.analyze(couple[0][0], TAX_YEAR, couple[0][1], couple[0][2], couple[1]),
+        couples,
+    ))
+    benchmarks.append(Benchmark(
+        "netfile.generate_xml[typical]",
+        lambda item: netfile.generate_xml(item[0], item[1]),
+        [(result, profile) for result, profile, _ in analyzed],
+    ))
+    return benchmarks
+
+def api_benchmarks(stack: ExitStack, scale: float) -> List[Benchmark]:
+    """
+    The FastAPI endpoints through an in-process client, request parsing and
+    response serialization included. Every request body is distinct so the
+    result cache never hits.
+    """
+    # Keep the submission queue's database out of the working tree
+    os.environ.setdefault("TAXSIMPLE_SUBMISSION_DB", os.path.join(stack.enter_context(tempfile.TemporaryDirectory()), "submissions.db"))
+    from fastapi.testclient import TestClient
+    import main
+
+    client = stack.enter_context(TestClient(main.app))
+    headers = {"Content-Type": "application/json"}
+
+    def post(path):
+        def call(body):
+            response = client.post(path, content=body, headers=headers)
+            response.raise_for_status()
+        return call
+
+    def bodies(returns):
+        return [json.dumps({"tax_year": TAX_YEAR, "profile": profile, "slips": slips}).encode() for profile, slips in returns]
+
+    benchmarks = []
+    for shape, count in (("typical", 500), ("heavy", 100)):
+        returns = generate_returns(_scaled(count, scale), shape, seed=3)
+        benchmarks.append(Benchmark(
+            f"POST /api/calculate[{shape}]", post("/api/calculate"), bodies(returns), reset=main.calculation_cache.clear
+        ))
+    returns = generate_returns(_scaled(300, scale), "typical", seed=4)
+    benchmarks.append(Benchmark(
+        "POST /api/optimize[typical]", post("/api/optimize"), bodies(returns), reset=main.calculation_cache.clear
+    ))
+
+    returns = generate_returns(_scaled(5, scale) * BATCH_SIZE, "typical", seed=5)
+    batch_bodies = [
+        json.dumps({
+            "tax_year": TAX_YEAR,
+            "returns": [{"profile": profile, "slips": slips} for profile, slips in returns[i:i + BATCH_SIZE]],
+        }).encode()
+        for i in range(0, len(returns), BATCH_SIZE)
+    ]
+    benchmarks.append(Benchmark(
+        f"POST /api/calculate/batch[{BATCH_SIZE}]", post("/api/calculate/batch?compact=true"), batch_bodies,
+        units=BATCH_SIZE, reset=main.calculation_cache.clear,
+    ))
+    return benchmarks
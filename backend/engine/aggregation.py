@@ -0,0 +1,53 @@
+from typing import List
+
+from engine.slips import Slip, parse_slip
+
+class SlipAggregates(dict):
+    """
+    Slip amounts grouped by slip type and box, built in a single pass:
+
+        {"T4": {"14": 60000.0, "22": 9000.0}, "RRSP": {"amount": 5000.0}}
+
+    It is a plain dict underneath so it serializes with the rest of the
+    calculation result and can be handed to any consumer of that result.
+    """
+
+    @classmethod
+    def from_slips(cls, slips: List[Slip]) -> "SlipAggregates":
+        aggregates = cls()
+        for slip in slips:
+            aggregates.add_slip(parse_slip(slip))
+        return aggregates
+
+    def add_slip(self, slip: Slip):
+        totals = self.get(slip.type)
+        if totals is None:
+            totals = self[slip.type] = {}
+        # Codes such as province of employment never reach amounts()
+        for key, value in slip.amounts():
+            totals[key] = totals.get(key, 0.0) + value
+
+    def rebuild(self, slip_types, slips: List[Slip]):
+        """
+        Recomputes the totals of the given slip types only, summing in slip
+        order so the result matches a fresh from_slips().
+        """
+        slip_types = set(slip_types)
+        for slip_type in slip_types:
+            self.pop(slip_type, None)
+        for slip in slips:
+            if slip.type in slip_types:
+                self.add_slip(slip)
+
+    def box(self, slip_type: str, box: str) -> float:
+        """
+        Total of one box across every slip of the given type.
+        """
+        totals = self.get(slip_type)
+        return totals.get(box, 0.0) if totals else 0.0
+
+    def amount(self, slip_type: str, field: str = "amount") -> float:
+        """
+        Total of a top-level field (amount, netIncome) across slips of a type.
+        """
+        return self.box(slip_type, field)
@@ -0,0 +1,177 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from engine.slips import Slip
+
+def _encode(value):
+    # Typed slips encode as their request form; anything else as its str()
+    return value.to_dict() if isinstance(value, Slip) else str(value)
+
+def calculation_key(tax_year: int, profile: Dict, slips: List[Dict]) -> str:
+    """
+    Content address of a return: SHA-256 of its canonical JSON encoding, so
+    the same payload hashes the same regardless of key order.
+    """
+    canonical = json.dumps([tax_year, profile, slips], sort_keys=True, separators=(",", ":"), default=_encode)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class SQLiteCacheBackend:
+    """
+    Second-level cache stored in a SQLite file so that every uvicorn worker
+    on the host shares hits. Values are stored as JSON, unencrypted, so
+    CalculationCache hands it only the `persist` form of a result.
+    """
+    PURGE_EVERY = 256
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS calculation_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM calculation_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float]):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO calculation_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, separators=(",", ":"), default=_encode), expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM calculation_cache WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM calculation_cache")
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+class CalculationCache:
+    """
+    In-process LRU cache of calculation results with a TTL and hit/miss
+    counters, optionally backed by a store shared between workers.
+
+    Cached results are shared between callers and must be treated as
+    read-only.
+
+    With a shared backend, `persist(value)` is what gets written to it and
+    `restore(stored)` turns a shared hit back into the value a local hit
+    would give; both default to the value unchanged.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 300.0, shared_backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_backend = shared_backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key: str, restore: Optional[Callable[[Any], Any]] = None) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.shared_backend is not None:
+            value = self.shared_backend.get(key)
+            if value is not None:
+                if restore is not None:
+                    value = restore(value)
+                self._store(key, value)
+                with self._lock:
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, persist: Optional[Callable[[Any], Any]] = None):
+        self._store(key, value)
+        if self.shared_backend is not None:
+            self.shared_backend.set(key, persist(value) if persist is not None else value, self.ttl)
+
+    def _store(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], persist: Optional[Callable[[Any], Any]] = None,
+                       restore: Optional[Callable[[Any], Any]] = None) -> Any:
+        value = self.get(key, restore)
+        if value is None:
+            value = compute()
+            self.set(key, value, persist)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.shared_backend is not None:
+            self.shared_backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+    def __getstate__(self):
+        # A copy sent to another process starts with an empty local tier
+        return {"max_entries": self.max_entries, "ttl": self.ttl, "shared_backend": self.shared_backend}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
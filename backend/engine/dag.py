@@ -1,141 +1,369 @@
-from typing import Dict, Any, List
+from collections import deque
+from functools import partial
+from typing import Dict, Any, List, Iterable, Tuple
+import threading
+import time
+
+import numpy as np
+
+from engine.aggregation import SlipAggregates
+from engine.cache import calculation_key
+from engine.metrics import NODE_SECONDS, SANITY_CHECK_SECONDS
+from engine.rates import RATE_TABLES
 from engine.recovery import TaxCalculationRecoveryService
+from engine.slips import Slip, parse_slips
+
+# Request inputs every node receives alongside its declared dependencies.
+INPUT_KEYS = ("slips", "profile")
 
 class TaxCalculationNode:
-    def __init__(self, node_id, calculation_func, dependencies=None):
+    """
+    A single step of the calculation DAG. Nodes hold no per-request state,
+    so a compiled plan can be shared by every request for a tax year.
+
+    `batch_func`, when given, computes the node for many returns at once from
+    NumPy columns of its dependencies and must match `calc_func` exactly.
+    `dtype` is the column type used when the node is evaluated in a batch.
+    """
+    __slots__ = ("node_id", "calc_func", "dependencies", "batch_func", "dtype")
+
+    def __init__(self, node_id, calculation_func, dependencies=None, batch_func=None, dtype=float):
         self.node_id = node_id
         self.calc_func = calculation_func
-        self.dependencies = dependencies or []
-        self.value = None
+        self.dependencies = tuple(dependencies or ())
+        self.batch_func = batch_func
+        self.dtype = dtype
 
-class TaxCalculationEngine:
-    def __init__(self):
-        self.recovery_service = TaxCalculationRecoveryService()
+# 0. Slip Aggregates (the only node that walks the slip list)
+def calc_slip_aggregates(deps):
+    return SlipAggregates.from_slips(deps.get("slips", []))
 
-    def build_dag(self, tax_year: int, profile: Dict, slips: List[Dict]):
-        nodes = {}
-        
-        # 1. Total Income Node
-        def calc_total_income(deps):
-            total = 0
-            for slip in deps.get("slips", []):
-                if slip.get("type") == "T4":
-                    total += slip.get("boxes", {}).get("14", 0)
-                elif slip.get("type") == "T4A":
-                    total += slip.get("boxes", {}).get("28", 0) # Other income
-                elif slip.get("type") == "T5":
-                    total += slip.get("boxes", {}).get("24", 0) # Dividends
-                elif slip.get("type") == "T2125":
-                    total += slip.get("netIncome", 0)
-            return total
-            
-        nodes["total_income"] = TaxCalculationNode("total_income", calc_total_income)
-
-        # 2. Net Income Node (Simplified: Total Income - basic deductions)
-        def calc_net_income(deps):
-            total_income = deps.get("total_income", 0)
-            # Deduct RRSP
-            rrsp_deduction = 0
-            for slip in deps.get("slips", []):
-                if slip.get("type") == "RRSP":
-                    rrsp_deduction += slip.get("amount", 0)
-            return max(0, total_income - rrsp_deduction)
-
-        nodes["net_income"] = TaxCalculationNode("net_income", calc_net_income, ["total_income"])
-
-        # 3. Taxable Income
-        def calc_taxable_income(deps):
-            return deps.get("net_income", 0)
-            
-        nodes["taxable_income"] = TaxCalculationNode("taxable_income", calc_taxable_income, ["net_income"])
-
-        # 4. Federal Tax
-        def calc_federal_tax(deps):
-            taxable = deps.get("taxable_income", 0)
-            # Basic 2025 brackets approximation
-            if taxable <= 55867:
-                return taxable * 0.15
-            elif taxable <= 111733:
-                return (55867 * 0.15) + ((taxable - 55867) * 0.205)
-            else:
-                return (55867 * 0.15) + ((111733 - 55867) * 0.205) + ((taxable - 111733) * 0.26)
-        
-        nodes["federal_tax"] = TaxCalculationNode("federal_tax", calc_federal_tax, ["taxable_income"])
-
-        # 5. Total Tax Deducted at Source
-        def calc_tax_deducted(deps):
-            deducted = 0
-            for slip in deps.get("slips", []):
-                if slip.get("type") == "T4":
-                    deducted += slip.get("boxes", {}).get("22", 0)
-                elif slip.get("type") == "T4A":
-                    deducted += slip.get("boxes", {}).get("22", 0)
-            return deducted
-            
-        nodes["tax_deducted"] = TaxCalculationNode("tax_deducted", calc_tax_deducted)
-
-        # 6. Refund or Balance (+ refund, - balance owing)
-        def calc_refund_or_balance(deps):
-            return deps.get("tax_deducted", 0) - deps.get("federal_tax", 0)
-            
-        nodes["refund_or_balance"] = TaxCalculationNode("refund_or_balance", calc_refund_or_balance, ["federal_tax", "tax_deducted"])
-        
-        return nodes
+# 1. Total Income Node
+def calc_total_income(deps):
+    slip_totals = deps["slip_aggregates"]
+    return (
+        slip_totals.box("T4", "14")
+        + slip_totals.box("T4A", "28") # Other income
+        + slip_totals.box("T5", "24") # Dividends
+        + slip_totals.amount("T2125", "netIncome")
+    )
 
-    def calculate(self, tax_year: int, profile: Dict, slips: List[Dict]) -> Dict:
-        """
-        Calculates the tax return by evaluating the DAG in topological order.
-        """
-        nodes = self.build_dag(tax_year, profile, slips)
-        
-        # Simple evaluation loop (for a true DAG you would do topological sort)
-        # We know the order for this simple setup.
-        computed_values = {"slips": slips, "profile": profile}
-        
-        evaluation_order = [
-            "total_income",
-            "tax_deducted",
-            "net_income",
-            "taxable_income",
-            "federal_tax",
-            "refund_or_balance"
+# 2. RRSP Deduction
+def calc_rrsp_deduction(deps):
+    return deps["slip_aggregates"].amount("RRSP")
+
+# 3. Net Income Node (Simplified: Total Income - basic deductions)
+def calc_net_income(deps):
+    return max(0.0, deps.get("total_income", 0) - deps.get("rrsp_deduction", 0))
+
+def calc_net_income_batch(cols):
+    return np.maximum(0.0, cols["total_income"] - cols["rrsp_deduction"])
+
+# 4. Taxable Income
+def calc_taxable_income(deps):
+    return deps.get("net_income", 0)
+
+def calc_taxable_income_batch(cols):
+    return cols["net_income"]
+
+# 5. Federal Tax (brackets are bound per tax year in build_dag)
+def calc_federal_tax(brackets, deps):
+    return brackets.tax(deps.get("taxable_income", 0))
+
+def calc_federal_tax_batch(brackets, cols):
+    return brackets.tax_array(cols["taxable_income"])
+
+# 6. Total Tax Deducted at Source
+def calc_tax_deducted(deps):
+    slip_totals = deps["slip_aggregates"]
+    return slip_totals.box("T4", "22") + slip_totals.box("T4A", "22")
+
+# 7. Refund or Balance (+ refund, - balance owing)
+def calc_refund_or_balance(deps):
+    return deps.get("tax_deducted", 0) - deps.get("federal_tax", 0)
+
+def calc_refund_or_balance_batch(cols):
+    return cols["tax_deducted"] - cols["federal_tax"]
+
+def sanity_check_inputs(computed_values: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The inputs the sanity rules read, from one return's computed values.
+    Values the return doesn't provide are left out, which skips the rules
+    that need them: the claimed age amount isn't calculated yet.
+    """
+    slip_totals = computed_values["slip_aggregates"]
+    inputs = {
+        "total_income": computed_values.get("total_income", 0),
+        "net_income": computed_values.get("net_income", 0),
+        "employment_income": slip_totals.box("T4", "14"),
+        "self_employment_income": slip_totals.amount("T2125", "netIncome"),
+        "investment_income": slip_totals.box("T5", "24"),
+        "other_income": slip_totals.box("T4A", "28"),
+        "cpp_contributions": slip_totals.box("T4", "16") + slip_totals.box("T4A", "16"),
+        "ei_contributions": slip_totals.box("T4", "18") + slip_totals.box("T4A", "18"),
+        "medical_expenses": slip_totals.amount("Medical"),
+    }
+    age = profile_age((computed_values.get("profile") or {}).get("age"))
+    if age is not None:
+        inputs["age"] = age
+    return inputs
+
+def profile_age(value):
+    """
+    The profile's age as a float, or None when it is missing or not a
+    number (the profile is free-form, so "67" counts and "senior" doesn't).
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        age = float(value)
+    except (TypeError, ValueError):
+        return None
+    return age if np.isfinite(age) else None
+
+def compact_result(computed_values: Dict[str, Any], fields=None) -> Dict[str, Any]:
+    """
+    Strips the echoed request inputs (slips and profile, SIN included) from
+    a calculation result, keeping node values and sanity checks. `fields`
+    narrows it further to the named keys.
+    """
+    if fields:
+        return {key: computed_values[key] for key in fields if key in computed_values and key not in INPUT_KEYS}
+    return {key: value for key, value in computed_values.items() if key not in INPUT_KEYS}
+
+def restore_result(stored: Dict[str, Any], profile: Dict, slips: List[Slip]) -> Dict[str, Any]:
+    """
+    Rebuilds a full calculation result from its compact_result() form, as
+    read back from JSON, and the request inputs it was computed from.
+    """
+    values = {"slips": slips, "profile": profile}
+    values.update(stored)
+    values["slip_aggregates"] = SlipAggregates(stored.get("slip_aggregates") or {})
+    return values
+
+def topological_order(nodes):
+    """
+    Kahn's algorithm. Ties are broken by registration order so the
+    evaluation order (and the key order of results) is deterministic.
+    """
+    dependents = {node_id: [] for node_id in nodes}
+    in_degree = {}
+    for node_id, node in nodes.items():
+        in_degree[node_id] = 0
+        for dep in node.dependencies:
+            if dep in INPUT_KEYS:
+                continue
+            if dep not in nodes:
+                raise ValueError(f"Node '{node_id}' depends on unknown node '{dep}'")
+            dependents[dep].append(node_id)
+            in_degree[node_id] += 1
+
+    ready = deque(node_id for node_id, degree in in_degree.items() if degree == 0)
+    order = []
+    while ready:
+        node_id = ready.popleft()
+        order.append(node_id)
+        for dependent in dependents[node_id]:
+            in_degree[dependent] -= 1
+            if in_degree[dependent] == 0:
+                ready.append(dependent)
+
+    if len(order) != len(nodes):
+        cyclic = sorted(node_id for node_id, degree in in_degree.items() if degree > 0)
+        raise ValueError(f"Calculation DAG has a cycle through: {', '.join(cyclic)}")
+    return order
+
+class TaxCalculationPlan:
+    """
+    A calculation DAG compiled for one tax year: the nodes in topological
+    order, ready to be evaluated against any number of returns.
+    """
+
+    def __init__(self, tax_year: int, nodes: Dict[str, TaxCalculationNode]):
+        self.tax_year = tax_year
+        self.nodes = nodes
+        self.order = topological_order(nodes)
+        self._steps = [
+            (node_id, nodes[node_id].calc_func, nodes[node_id].dependencies)
+            for node_id in self.order
         ]
-        
-        for node_id in evaluation_order:
-            node = nodes[node_id]
-            # Gather dependencies
-            deps = {dep: computed_values.get(dep) for dep in node.dependencies}
+        self._batch_steps = [
+            (node_id, nodes[node_id].calc_func, nodes[node_id].batch_func, nodes[node_id].dependencies)
+            for node_id in self.order
+        ]
+
+    def evaluate(self, profile: Dict, slips: List[Slip], observe=None) -> Dict[str, Any]:
+        """
+        Evaluates every node for one return. Only the slips and profile are
+        passed in; all other state lives in the returned values dict.
+        With `observe`, each node's wall time is reported as
+        observe(seconds, (node_id,)).
+        """
+        values = {"slips": slips, "profile": profile}
+        for node_id, calc_func, dependencies in self._steps:
+            deps = {dep: values.get(dep) for dep in dependencies}
             deps["slips"] = slips
             deps["profile"] = profile
-            # Compute
-            val = node.calc_func(deps)
-            computed_values[node_id] = val
-
-        # Run sanity checks
-        class MockTaxReturn:
-            def __init__(self, data):
-                self.tax_year = tax_year
-                self.total_income = data.get("total_income", 0)
-                self.net_income = data.get("net_income", 0)
-                
-                # Mock pieces mapping
-                self.employment_income = sum(s.get("boxes", {}).get("14", 0) for s in slips if s.get("type") == "T4")
-                self.self_employment_income = sum(s.get("netIncome", 0) for s in slips if s.get("type") == "T2125")
-                self.investment_income = sum(s.get("boxes", {}).get("24", 0) for s in slips if s.get("type") == "T5")
-                self.other_income = sum(s.get("boxes", {}).get("28", 0) for s in slips if s.get("type") == "T4A")
-                
-                self.cpp_contributions = sum(s.get("boxes", {}).get("16", 0) for s in slips if s.get("type") in ["T4", "T4A"])
-                self.ei_contributions = sum(s.get("boxes", {}).get("18", 0) for s in slips if s.get("type") in ["T4", "T4A"])
-                
-                # Default mocks for the rest of the checks
-                self.age = 30
-                self.claiming_age_amount = False
-                self.age_amount = 0
-                self.income = data.get("net_income", 0)
-                self.medical_expenses = sum(s.get("amount", 0) for s in slips if s.get("type") == "Medical")
-            
-        mock_return = MockTaxReturn(computed_values)
-        sanity_checks = self.recovery_service.validate_calculation_consistency(mock_return)
-        computed_values["sanity_checks"] = sanity_checks
+            if observe is None:
+                values[node_id] = calc_func(deps)
+            else:
+                start = time.perf_counter()
+                values[node_id] = calc_func(deps)
+                observe(time.perf_counter() - start, (node_id,))
+        return values
+
+    def propagate(self, values: Dict[str, Any], changed: Iterable[str]) -> Dict[str, Any]:
+        """
+        Recomputes, in place, only the nodes downstream of `changed` (node
+        ids or input keys whose values were already updated in `values`).
+        A node whose new value equals its old one stops the propagation.
+        Returns the nodes whose values changed.
+        """
+        changed = set(changed)
+        delta = {}
+        for node_id, calc_func, dependencies in self._steps:
+            if node_id in changed or changed.isdisjoint(dependencies):
+                continue
+            deps = {dep: values.get(dep) for dep in dependencies}
+            deps["slips"] = values["slips"]
+            deps["profile"] = values["profile"]
+            value = calc_func(deps)
+            if value != values.get(node_id):
+                values[node_id] = value
+                changed.add(node_id)
+                delta[node_id] = value
+        return delta
+
+    def evaluate_batch(self, returns: List[Tuple[Dict, List[Slip]]]) -> List[Dict[str, Any]]:
+        """
+        Evaluates the plan column-wise for many (profile, slips) returns.
+        Nodes with a batch_func run once over float64 columns; the others
+        (slip aggregation and its readers) fill their column one return at
+        a time. Each returned dict matches what evaluate() gives for that
+        return.
+        """
+        count = len(returns)
+        columns = {}
+        for node_id, calc_func, batch_func, dependencies in self._batch_steps:
+            if batch_func is not None:
+                column = batch_func({dep: columns[dep] for dep in dependencies if dep in columns})
+            else:
+                column = np.empty(count, dtype=self.nodes[node_id].dtype)
+                for i, (profile, slips) in enumerate(returns):
+                    deps = {dep: columns[dep][i] for dep in dependencies if dep in columns}
+                    deps["slips"] = slips
+                    deps["profile"] = profile
+                    column[i] = calc_func(deps)
+            columns[node_id] = column
 
+        results = [{"slips": slips, "profile": profile} for profile, slips in returns]
+        for node_id in self.order:
+            for values, value in zip(results, columns[node_id].tolist()):
+                values[node_id] = value
+        return results
+
+class TaxCalculationEngine:
+    def __init__(self, cache=None, rates=None, instrument=False):
+        self.rates = rates or RATE_TABLES
+        # Record per-node and sanity-check wall times in engine.metrics
+        self.instrument = instrument
+        self.recovery_service = TaxCalculationRecoveryService(self.rates)
+        # Optional CalculationCache memoizing calculate() by payload hash
+        self.cache = cache
+        self._plans = {}
+        self._plans_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Compiled plans and the lock are rebuilt in the receiving process
+        state = self.__dict__.copy()
+        del state["_plans"], state["_plans_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._plans = {}
+        self._plans_lock = threading.Lock()
+
+    def build_dag(self, tax_year: int) -> Dict[str, TaxCalculationNode]:
+        """
+        Declares the calculation nodes for a tax year. Evaluation order is
+        derived from the dependencies, so new nodes only need to be added here.
+        """
+        rules = self.rates.for_year(tax_year)
+        nodes = {}
+        nodes["slip_aggregates"] = TaxCalculationNode("slip_aggregates", calc_slip_aggregates, ["slips"], dtype=object)
+        nodes["total_income"] = TaxCalculationNode("total_income", calc_total_income, ["slip_aggregates"])
+        nodes["rrsp_deduction"] = TaxCalculationNode("rrsp_deduction", calc_rrsp_deduction, ["slip_aggregates"])
+        nodes["net_income"] = TaxCalculationNode("net_income", calc_net_income, ["total_income", "rrsp_deduction"], calc_net_income_batch)
+        nodes["taxable_income"] = TaxCalculationNode("taxable_income", calc_taxable_income, ["net_income"], calc_taxable_income_batch)
+        nodes["federal_tax"] = TaxCalculationNode(
+            "federal_tax",
+            partial(calc_federal_tax, rules.federal),
+            ["taxable_income"],
+            partial(calc_federal_tax_batch, rules.federal),
+        )
+        nodes["tax_deducted"] = TaxCalculationNode("tax_deducted", calc_tax_deducted, ["slip_aggregates"])
+        nodes["refund_or_balance"] = TaxCalculationNode("refund_or_balance", calc_refund_or_balance, ["federal_tax", "tax_deducted"], calc_refund_or_balance_batch)
+        return nodes
+
+    def compile(self, tax_year: int) -> TaxCalculationPlan:
+        """
+        Returns the compiled plan for a tax year, building it on first use.
+        Plans are cached per rate-table year, so the cache stays bounded.
+        """
+        rules_year = self.rates.for_year(tax_year).year
+        plan = self._plans.get(rules_year)
+        if plan is None:
+            with self._plans_lock:
+                plan = self._plans.get(rules_year)
+                if plan is None:
+                    plan = TaxCalculationPlan(rules_year, self.build_dag(rules_year))
+                    self._plans[rules_year] = plan
+        return plan
+
+    def calculate(self, tax_year: int, profile: Dict, slips: List[Slip]) -> Dict:
+        """
+        Calculates the tax return by evaluating the compiled DAG for the year.
+        With a cache configured, identical payloads reuse the earlier result,
+        which callers must not mutate.
+        """
+        slips = parse_slips(slips)
+        if self.cache is None:
+            return self._calculate(tax_year, profile, slips)
+        key = calculation_key(tax_year, profile, slips)
+        return self.cache.get_or_compute(
+            key,
+            lambda: self._calculate(tax_year, profile, slips),
+            # Only computed values leave the process: never the profile or SIN
+            persist=compact_result,
+            restore=lambda stored: restore_result(stored, profile, slips),
+        )
+
+    def _calculate(self, tax_year: int, profile: Dict, slips: List[Slip]) -> Dict:
+        if not self.instrument:
+            computed_values = self.compile(tax_year).evaluate(profile, slips)
+            computed_values["sanity_checks"] = self.run_sanity_checks(tax_year, computed_values)
+            return computed_values
+        computed_values = self.compile(tax_year).evaluate(profile, slips, observe=NODE_SECONDS.observe)
+        start = time.perf_counter()
+        computed_values["sanity_checks"] = self.run_sanity_checks(tax_year, computed_values)
+        SANITY_CHECK_SECONDS.observe(time.perf_counter() - start)
         return computed_values
+
+    def calculate_batch(self, tax_year: int, returns: Iterable[Tuple[Dict, List[Slip]]]) -> List[Dict]:
+        """
+        Calculates many (profile, slips) returns for one tax year in a single
+        column-wise pass. Each result is identical to calculate() for that return.
+        """
+        returns = [(profile, parse_slips(slips)) for profile, slips in returns]
+        results = self.compile(tax_year).evaluate_batch(returns)
+        checks = self.recovery_service.run_checks_batch(tax_year, [sanity_check_inputs(values) for values in results])
+        for computed_values, sanity_checks in zip(results, checks):
+            computed_values["sanity_checks"] = sanity_checks
+        return results
+
+    def run_sanity_checks(self, tax_year: int, computed_values: Dict) -> List[Dict]:
+        """
+        Runs the recovery service's sanity rules over computed values.
+        """
+        return self.recovery_service.run_checks(tax_year, sanity_check_inputs(computed_values))
@@ -0,0 +1,116 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+import asyncio
+import os
+
+from engine.metrics import METRICS
+
+# Services available to jobs in this process: the API's engine, optimizer
+# and netfile_service singletons, installed by _init_worker.
+_services: Dict[str, Any] = {}
+_profiler = None
+# Set in pool workers, whose metrics are shipped back with each result
+_drain_metrics = False
+
+def _init_worker(services: Dict[str, Any], profiler=None, drain_metrics=False):
+    global _services, _profiler, _drain_metrics
+    _services = services
+    _profiler = profiler
+    _drain_metrics = drain_metrics
+    # Pre-warm: compile the calculation plan of every supported year
+    engine = services.get("engine")
+    if engine is not None:
+        for year in engine.rates.years:
+            engine.compile(year)
+
+def _invoke(job: Callable, args: tuple, profile: bool = False):
+    if profile and _profiler is not None:
+        result = _profiler.run(job.__name__, job, _services, *args)
+    else:
+        result = job(_services, *args)
+    return result, METRICS.drain() if _drain_metrics else None
+
+def _ready():
+    return os.getpid()
+
+class Overloaded(Exception):
+    """
+    Raised when the in-flight queue is full and a request is shed.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__("Server is at capacity, retry later")
+        self.retry_after = retry_after
+
+class EngineExecutor:
+    """
+    Runs CPU-bound engine and optimizer jobs off the event loop, either on a
+    thread pool or on a process pool whose workers hold their own copies of
+    the service singletons. At most `max_inflight` jobs are queued or
+    running; beyond that, requests are shed with Overloaded.
+
+    Jobs are module-level functions called as `job(services, *args)`. With
+    a SampledProfiler, a sample of jobs is profiled where it runs.
+    """
+
+    def __init__(self, services: Dict[str, Any], mode: str = "thread", workers: int = None,
+                 max_inflight: int = None, retry_after: int = 1, profiler=None):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown execution mode '{mode}'")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.max_inflight = max_inflight or self.workers * 4
+        self.retry_after = retry_after
+        self.inflight = 0
+        self.shed = 0
+        self._slots = None
+        self.profiler = profiler
+        if mode == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(services, profiler, True)
+            )
+        else:
+            _init_worker(services, profiler)
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="engine")
+
+    async def start(self):
+        """
+        Starts every worker up front so the first requests don't pay for
+        process start-up and plan compilation.
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _ready) for _ in range(self.workers)))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, job: Callable, *args, shed: bool = True):
+        """
+        Runs `job` on the pool. With `shed` the call fails fast with
+        Overloaded when the queue is full; otherwise it waits for a slot,
+        which suits streaming callers that already apply backpressure.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_inflight)
+        if shed and self._slots.locked():
+            self.shed += 1
+            raise Overloaded(self.retry_after)
+        async with self._slots:
+            self.inflight += 1
+            try:
+                profile = self.profiler is not None and self.profiler.should_sample()
+                result, metrics = await asyncio.get_running_loop().run_in_executor(self._pool, _invoke, job, args, profile)
+                if metrics:
+                    METRICS.merge(metrics)
+                return result
+            finally:
+                self.inflight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "shed": self.shed,
+        }
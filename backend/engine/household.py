@@ -0,0 +1,133 @@
+"""
+Joint optimization of two spouses' returns. Every combination of pension
+split, medical-expense claimant and donation placement is laid out as one
+numpy grid and both spouses' federal tax is computed for the whole grid in
+a single pass over the bracket tables, instead of recalculating a return
+per candidate.
+"""
+from typing import Dict
+
+import numpy as np
+
+from engine.rates import TaxYearRules
+
+# Pension splitting lets up to half of eligible pension income move to the spouse
+PENSION_SPLIT_MAX = 0.5
+PENSION_SPLIT_AGE = 65
+# The engine doesn't count T4A box 16 in total income yet, so there is no
+# taxed pension income to split; the search skips splits until it does
+SPLIT_PENSION = False
+
+def eligible_pension(tax_return) -> float:
+    # An unknown age (None) isn't eligible
+    age = tax_return.age
+    return tax_return.pension_income if age is not None and age >= PENSION_SPLIT_AGE else 0.0
+
+def donation_credit(rules: TaxYearRules, taxable: np.ndarray, donations: np.ndarray) -> np.ndarray:
+    low = np.minimum(donations, rules.donation_low_tier)
+    above = donations - low
+    # The top rate applies only to the extent of income in the top bracket
+    top = np.minimum(above, np.maximum(taxable - rules.federal.thresholds[-1], 0.0))
+    return low * rules.federal.rates[0] + (above - top) * rules.donation_high_rate + top * rules.donation_top_rate
+
+def spouse_tax(rules: TaxYearRules, net: np.ndarray, taxable: np.ndarray,
+               medical: np.ndarray, donations: np.ndarray) -> np.ndarray:
+    """
+    Federal tax after the medical and donation credits, column-wise. Both
+    credits are non-refundable, so tax never drops below zero.
+    """
+    net = np.maximum(net, 0.0)
+    taxable = np.maximum(taxable, 0.0)
+    floor = np.minimum(net * rules.medical_threshold_rate, rules.medical_threshold_max)
+    credits = np.maximum(medical - floor, 0.0) * rules.federal.rates[0]
+    credits = credits + donation_credit(rules, taxable, np.minimum(donations, net * rules.donation_income_limit))
+    return np.maximum(rules.federal.tax_array(taxable) - credits, 0.0)
+
+def household_tax(rules: TaxYearRules, primary, spouse, shift, medical_share, donation_share) -> np.ndarray:
+    """
+    Combined tax of both spouses. `shift` is income moved from the primary
+    return to the spouse's (negative moves it the other way);
+    `medical_share` and `donation_share` are the parts of the household's
+    medical expenses and donations claimed on the primary return. The
+    arguments broadcast against each other.
+    """
+    medical = primary.total_medical_expenses + spouse.total_medical_expenses
+    donations = primary.charitable_donations + spouse.charitable_donations
+    return (
+        spouse_tax(rules, primary.net_income - shift, primary.taxable_income - shift,
+                   medical * medical_share, donations * donation_share)
+        + spouse_tax(rules, spouse.net_income + shift, spouse.taxable_income + shift,
+                     medical * (1 - medical_share), donations * (1 - donation_share))
+    )
+
+def _own_share(primary_amount: float, spouse_amount: float) -> float:
+    total = primary_amount + spouse_amount
+    return primary_amount / total if total > 0 else 1.0
+
+def _axis(values, baseline: float):
+    # Sorted candidate values with the as-filed value always included
+    axis = np.unique(np.append(values, baseline))
+    return axis, int(np.searchsorted(axis, baseline))
+
+def optimize_household(rules: TaxYearRules, primary, spouse, split_steps: int = 51, donation_steps: int = 11,
+                       split_pension: bool = SPLIT_PENSION) -> Dict:
+    """
+    Searches pension splits of 0-50% in either direction (with
+    `split_pension`), claiming the medical expenses on either return, and
+    `donation_steps` placements of the donations between the two returns.
+    The as-filed plan (no split, each spouse claiming their own receipts)
+    is part of the grid. Among plans within a cent of the lowest tax, the
+    one closest to as-filed wins, so nothing is moved for no gain.
+
+    The savings are attributed to the parts of the plan by applying them
+    one at a time (pension split, then medical, then donations) to the
+    as-filed plan, so the parts add up to the total.
+    """
+    fractions = np.linspace(0.0, PENSION_SPLIT_MAX, split_steps) if split_pension else np.zeros(1)
+    shifts, s0 = _axis(np.concatenate([-fractions * eligible_pension(spouse), fractions * eligible_pension(primary)]), 0.0)
+
+    medical_baseline = _own_share(primary.total_medical_expenses, spouse.total_medical_expenses)
+    medical_shares, m0 = _axis([0.0, 1.0] if primary.total_medical_expenses + spouse.total_medical_expenses > 0 else [],
+                               medical_baseline)
+    donation_baseline = _own_share(primary.charitable_donations, spouse.charitable_donations)
+    donation_shares, d0 = _axis(np.linspace(0.0, 1.0, donation_steps) if primary.charitable_donations + spouse.charitable_donations > 0 else [],
+                                donation_baseline)
+
+    shift, medical_share, donation_share = np.meshgrid(shifts, medical_shares, donation_shares, indexing="ij")
+    tax = household_tax(rules, primary, spouse, shift, medical_share, donation_share)
+
+    # Tie-break towards the as-filed plan: smallest change first
+    change = (
+        np.abs(shift) / (np.abs(shifts).max() or 1.0)
+        + np.abs(medical_share - medical_baseline)
+        + np.abs(donation_share - donation_baseline)
+    )
+    change = np.where(tax <= tax.min() + 0.01, change, np.inf)
+    i, m, d = np.unravel_index(np.argmin(change), tax.shape)
+
+    baseline = float(tax[s0, m0, d0])
+    split = float(tax[i, m0, d0])
+    split_and_medical = float(tax[i, m, d0])
+    optimized = float(tax[i, m, d])
+    return {
+        'baseline_tax': baseline,
+        'optimized_tax': optimized,
+        'savings': baseline - optimized,
+        'pension_shift': float(shifts[i]),
+        'pension_savings': baseline - split,
+        'medical_share': float(medical_shares[m]),
+        'medical_savings': split - split_and_medical,
+        'donation_share': float(donation_shares[d]),
+        'donation_savings': split_and_medical - optimized,
+        'candidates': int(tax.size),
+    }
+
+def income_shift_savings(rules: TaxYearRules, primary, spouse, plan: Dict, amount: float, steps: int = 11) -> Dict:
+    """
+    Household tax saved by moving up to `amount` of income from the primary
+    return to the spouse's (negative: the other way) on top of `plan`.
+    """
+    shifts = np.linspace(0.0, amount, steps)
+    tax = household_tax(rules, primary, spouse, plan['pension_shift'] + shifts, plan['medical_share'], plan['donation_share'])
+    best = int(np.argmin(tax))
+    return {'shift': float(shifts[best]), 'savings': float(tax[0] - tax[best])}
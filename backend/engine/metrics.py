@@ -0,0 +1,193 @@
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import threading
+
+# Latency buckets in seconds, from 10µs (a single DAG node) to 10s
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+def _format_labels(labelnames: Tuple[str, ...], labels: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    A monotonically increasing count per label set.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: Tuple = ()):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def drain(self) -> Dict[Tuple, float]:
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[Tuple, float]):
+        with self._lock:
+            for labels, value in series.items():
+                self._series[labels] = self._series.get(labels, 0) + value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = dict(self._series)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(series.items())
+        ]
+
+class Histogram:
+    """
+    Observations counted into fixed upper-bound buckets, Prometheus style.
+    An observation is one bisect and three increments under a lock.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Tuple = ()):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def drain(self) -> Dict[Tuple, list]:
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[Tuple, list]):
+        with self._lock:
+            for labels, (counts, total, count) in series.items():
+                own = self._series.get(labels)
+                if own is None:
+                    own = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                own[0] = [a + b for a, b in zip(own[0], counts)]
+                own[1] += total
+                own[2] += count
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        lines = []
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """
+    The metrics of one process, rendered in the Prometheus text format.
+
+    Process-pool workers drain() what they recorded after each job and the
+    API process merge()s it, so /metrics covers work done in any process.
+    Collectors add point-in-time values (cache, queue and executor stats)
+    at render time.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]):
+        """
+        `collector()` yields (name, type, help, labels dict, value) samples.
+        """
+        self.collectors.append(collector)
+
+    def drain(self) -> Dict[str, Dict]:
+        delta = {}
+        for name, metric in list(self.metrics.items()):
+            series = metric.drain()
+            if series:
+                delta[name] = series
+        return delta
+
+    def merge(self, delta: Dict[str, Dict]):
+        for name, series in delta.items():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(series)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            samples = metric.samples()
+            if samples:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                lines.extend(samples)
+        described = set()
+        for collector in self.collectors:
+            for name, kind, help, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {help}")
+                    lines.append(f"# TYPE {name} {kind}")
+                labelnames = tuple(labels)
+                lines.append(f"{name}{_format_labels(labelnames, tuple(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Shared by everything in this process
+METRICS = MetricsRegistry()
+
+NODE_SECONDS = METRICS.histogram(
+    "taxsimple_dag_node_seconds", "Wall time of each calculation DAG node", ("node",)
+)
+SANITY_CHECK_SECONDS = METRICS.histogram(
+    "taxsimple_sanity_checks_seconds", "Wall time of the sanity-check phase of a calculation"
+)
+ANALYZER_SECONDS = METRICS.histogram(
+    "taxsimple_analyzer_seconds", "Wall time of each optimizer analyzer", ("analyzer",)
+)
@@ -1,108 +1,309 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+import time
+
+from engine.aggregation import SlipAggregates
+from engine.dag import profile_age
+from engine.household import eligible_pension, income_shift_savings, optimize_household
+from engine.metrics import ANALYZER_SECONDS
+from engine.rates import RATE_TABLES
+
+class TaxReturnHelper:
+    """
+    Helper object built from the raw dictionaries to match the analyzers' expected interface
+    """
+    def __init__(self, result, year, prof, slp, spouse_return=None):
+        self.tax_year = year
+        # Only a return filed together with the spouse's can be optimized as a couple
+        self.has_spouse = spouse_return is not None
+        # The spouse's TaxReturnHelper, when both returns are optimized together
+        self.spouse_return = spouse_return
+        # optimize_household()'s plan for the couple
+        self.household = None
+        self.total_income = result.get("total_income", 0)
+        self.net_income = result.get("net_income", 0)
+        self.taxable_income = result.get("taxable_income", 0)
+        
+        # Reuse the engine's slip totals rather than rescanning the slips
+        slip_totals = result.get("slip_aggregates")
+        if slip_totals is None:
+            slip_totals = SlipAggregates.from_slips(slp)
+        elif not isinstance(slip_totals, SlipAggregates):
+            slip_totals = SlipAggregates(slip_totals)
+        
+        # RRSP
+        self.rrsp_deduction_limit = prof.get("rrsp_limit", 30000)
+        self.available_cash = prof.get("available_cash", 10000)
+        
+        # Medical
+        self.total_medical_expenses = slip_totals.amount("Medical")
+        
+        # Donations
+        self.charitable_donations = slip_totals.amount("Donation")
+        
+        # Pension; None when the profile's age isn't a number
+        self.age = profile_age(prof.get("age", 30))
+        self.pension_income = slip_totals.box("T4A", "16")
+
+        # Investment income, the usual target of income splitting
+        self.investment_income = slip_totals.box("T5", "24")
+        
+        # HBP
+        self.has_hbp_balance = prof.get("hbp_balance", 0) > 0
+
+class Analyzer:
+    __slots__ = ("name", "func", "time_budget")
+
+    def __init__(self, name, func, time_budget=None):
+        self.name = name
+        self.func = func
+        self.time_budget = time_budget
+
+    def timed(self, tax_return):
+        # Observed when the analyzer finishes, even past its budget
+        start = time.perf_counter()
+        try:
+            return self.func(tax_return)
+        finally:
+            ANALYZER_SECONDS.observe(time.perf_counter() - start, (self.name,))
+
+class AnalyzerRun:
+    """
+    One analyzer's run for one request. `started_at` is set when a pool
+    thread picks it up, so the analyzer's time budget doesn't count time
+    spent queued behind other requests' analyzers.
+    """
+    __slots__ = ("analyzer", "instrument", "started", "started_at")
+
+    def __init__(self, analyzer, instrument=False):
+        self.analyzer = analyzer
+        self.instrument = instrument
+        self.started = threading.Event()
+        self.started_at = None
+
+    def __call__(self, tax_return):
+        self.started_at = time.monotonic()
+        self.started.set()
+        if self.instrument:
+            return self.analyzer.timed(tax_return)
+        return self.analyzer.func(tax_return)
+
 class OptimizationEngine:
     """
     Finds hidden savings and optimizations
     """
+
+    def __init__(self, rates=None, default_time_budget=0.5, max_workers=None, executor=None, instrument=False,
+                 start_budget=None):
+        self.rates = rates or RATE_TABLES
+        # Record each analyzer's wall time in engine.metrics
+        self.instrument = instrument
+        self.default_time_budget = default_time_budget
+        # How long a request waits for its analyzers to get a pool thread;
+        # defaults to the longest analyzer budget
+        self.start_budget = start_budget
+        self.max_workers = max_workers
+        # A thread pool shared by every request; one is created on first use.
+        # Analyzers share the request's tax return in memory, so it must be
+        # thread-based.
+        self.executor = executor
+        self._executor_lock = threading.Lock()
+        self.analyzers = {}
+        self.register_analyzer('rrsp', self.rrsp_opportunities)
+        self.register_analyzer('spousal_attribution', self.spousal_attribution_opportunities)
+        self.register_analyzer('medical_expenses', self.medical_expense_opportunities)
+        self.register_analyzer('donation_carryforward', self.donation_carryforward_opportunities)
+        self.register_analyzer('pension_splitting', self.pension_splitting_opportunities)
+        self.register_analyzer('hbp_repayment', self.hbp_repayment_opportunities)
+        self.register_analyzer('donation_pooling', self.donation_pooling_opportunities)
     
-    def analyze(self, base_result, tax_year, profile, slips):
+    def __getstate__(self):
+        # Each process creates its own analyzer pool
+        state = self.__dict__.copy()
+        state["executor"] = None
+        del state["_executor_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._executor_lock = threading.Lock()
+
+    def analyze(self, base_result, tax_year, profile, slips, spouse=None):
         """
         Run through optimization scenarios based on the user's base return.
         """
+        return self.run_analyzers(base_result, tax_year, profile, slips, spouse)['opportunities']
+
+    def register_analyzer(self, name, func, time_budget=None):
+        """
+        Adds an analyzer. `func(tax_return)` returns a list of opportunities;
+        `time_budget` (seconds) overrides the engine's default budget.
+        """
+        self.analyzers[name] = Analyzer(name, func, time_budget)
+
+    def run_analyzers(self, base_result, tax_year, profile, slips, spouse=None):
+        """
+        Runs every registered analyzer concurrently. An analyzer that misses
+        its time budget or raises is reported in `partial` instead of holding
+        up the response; a late one keeps running in the background and its
+        result is discarded. Budgets count from when each analyzer starts
+        running, not from when it was queued; one still queued once
+        `start_budget` has passed since the call began is reported as
+        `not_started`.
+
+        `spouse` is the spouse's (result, profile, slips); with it the
+        household analyzers optimize both returns together. A household
+        search that fails is reported in `partial` as `household`.
+        """
+        tax_return = self.build_tax_return(base_result, tax_year, profile, slips, spouse)
+        partial = []
+        if tax_return.spouse_return is not None:
+            # The household analyzers share one plan; without it they find nothing
+            try:
+                tax_return.household = self.optimize_household(tax_return)
+            except Exception as exc:
+                partial.append({'analyzer': 'household', 'reason': 'error', 'error': str(exc)})
+
+        start_deadline = time.monotonic() + self._start_budget()
+        executor = self._get_executor()
+        submitted = []
+        for analyzer in self.analyzers.values():
+            run = AnalyzerRun(analyzer, self.instrument)
+            submitted.append((analyzer, run, executor.submit(run, tax_return)))
+
         opportunities = []
-        
-        # Build a helper object from the raw dictionaries to match the user's expected interface
-        class TaxReturnHelper:
-            def __init__(self, result, year, prof, slp):
-                self.tax_year = year
-                self.has_spouse = prof.get("marital_status") in ["Married", "Common-law"]
-                self.spouse_return = None # Mock
-                self.total_income = result.get("total_income", 0)
-                self.net_income = result.get("net_income", 0)
-                self.taxable_income = result.get("taxable_income", 0)
-                
-                # RRSP
-                self.rrsp_deduction_limit = prof.get("rrsp_limit", 30000)
-                self.available_cash = prof.get("available_cash", 10000)
-                
-                # Medical
-                self.total_medical_expenses = sum(s.get("amount", 0) for s in slp if s.get("type") == "Medical")
-                
-                # Donations
-                self.charitable_donations = sum(s.get("amount", 0) for s in slp if s.get("type") == "Donation")
-                
-                # Pension
-                self.age = prof.get("age", 30)
-                self.pension_income = sum(s.get("boxes", {}).get("16", 0) for s in slp if s.get("type") in ["T4A"])
-                
-                # HBP
-                self.has_hbp_balance = prof.get("hbp_balance", 0) > 0
-
-        tax_return = TaxReturnHelper(base_result, tax_year, profile, slips)
-        
-        # RRSP optimization
-        if self.should_contribute_to_rrsp(tax_return):
-            optimal_contribution = self.calculate_optimal_rrsp_contribution(tax_return)
-            if optimal_contribution['amount'] > 0:
-                opportunities.append({
-                    'type': 'RRSP_CONTRIBUTION',
-                    'savings': optimal_contribution['tax_savings'],
-                    'message': f"Contributing ${optimal_contribution['amount']:,.0f} to your RRSP would save you ${optimal_contribution['tax_savings']:,.0f}",
-                    'deadline': f'March 1, {tax_year + 1}'
-                })
-            
-        # Spousal attribution
-        if tax_return.has_spouse:
-            spousal_savings = self.analyze_spousal_attribution(tax_return, tax_return.spouse_return)
-            if spousal_savings.get('total_savings', 0) > 500:
-                opportunities.append({
-                    'type': 'SPOUSAL_ATTRIBUTION',
-                    'savings': spousal_savings['total_savings'],
-                    'message': spousal_savings['recommendation']
-                })
-                
-        # Medical expense optimization
-        if tax_return.total_medical_expenses > 3000:
-            medical_savings = self.optimize_medical_expenses(tax_return)
-            if medical_savings.get('better_on_lower_income', False):
-                opportunities.append({
-                    'type': 'MEDICAL_EXPENSES',
-                    'savings': medical_savings['additional_refund'],
-                    'message': "Claiming medical expenses on the lower-income spouse's return would increase your refund"
-                })
-                
-        # Donation carry-forward
-        if tax_return.charitable_donations > 200:
-            donation_analysis = self.analyze_donation_carryforward(tax_return)
-            if donation_analysis.get('should_carry_forward', False):
-                opportunities.append({
-                    'type': 'DONATION_CARRYFORWARD',
-                    'savings': donation_analysis['future_savings'],
-                    'message': "Carrying forward part of your donations to next year would maximize tax savings"
-                })
-                
-        # Pension splitting (for seniors)
-        if tax_return.age >= 65 and tax_return.pension_income > 0:
-            pension_savings = self.analyze_pension_splitting(tax_return, tax_return.spouse_return)
-            if pension_savings.get('savings', 0) > 0:
-                opportunities.append(pension_savings)
-                
-        # Home Buyers' Plan (HBP) repayment
-        if tax_return.has_hbp_balance:
-            hbp_analysis = self.analyze_hbp_repayment(tax_return)
-            if hbp_analysis.get('should_repay_more', False):
-                opportunities.append(hbp_analysis)
-                
-        return sorted(opportunities, key=lambda x: x['savings'], reverse=True)
+        for analyzer, run, future in submitted:
+            budget = self._budget(analyzer)
+            # Only analyzers that started in time are waited on, so the call
+            # takes at most the start budget plus the longest analyzer budget
+            if not run.started.wait(max(0.0, start_deadline - time.monotonic())) or run.started_at > start_deadline:
+                future.cancel()
+                partial.append({'analyzer': analyzer.name, 'reason': 'not_started', 'time_budget': budget})
+                continue
+            try:
+                opportunities.extend(future.result(timeout=max(0.0, run.started_at + budget - time.monotonic())))
+            except FutureTimeoutError:
+                future.cancel()
+                partial.append({'analyzer': analyzer.name, 'reason': 'timeout', 'time_budget': budget})
+            except Exception as exc:
+                partial.append({'analyzer': analyzer.name, 'reason': 'error', 'error': str(exc)})
+
+        return {
+            'opportunities': sorted(opportunities, key=lambda x: x['savings'], reverse=True),
+            'partial': partial,
+            'household': tax_return.household,
+        }
+
+    def _budget(self, analyzer):
+        return analyzer.time_budget if analyzer.time_budget is not None else self.default_time_budget
+
+    def _start_budget(self):
+        if self.start_budget is not None:
+            return self.start_budget
+        return max((self._budget(analyzer) for analyzer in self.analyzers.values()), default=self.default_time_budget)
+
+    def _get_executor(self):
+        if self.executor is None:
+            with self._executor_lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="analyzer")
+        return self.executor
+
+    # RRSP optimization
+    def rrsp_opportunities(self, tax_return):
+        if not self.should_contribute_to_rrsp(tax_return):
+            return []
+        optimal_contribution = self.calculate_optimal_rrsp_contribution(tax_return)
+        if optimal_contribution['amount'] <= 0:
+            return []
+        return [{
+            'type': 'RRSP_CONTRIBUTION',
+            'savings': optimal_contribution['tax_savings'],
+            'message': f"Contributing ${optimal_contribution['amount']:,.0f} to your RRSP would save you ${optimal_contribution['tax_savings']:,.0f}",
+            'deadline': f'March 1, {tax_return.tax_year + 1}'
+        }]
+
+    # Spousal attribution
+    def spousal_attribution_opportunities(self, tax_return):
+        if not tax_return.has_spouse:
+            return []
+        spousal_savings = self.analyze_spousal_attribution(tax_return, tax_return.spouse_return)
+        if spousal_savings.get('total_savings', 0) <= 500:
+            return []
+        return [{
+            'type': 'SPOUSAL_ATTRIBUTION',
+            'savings': spousal_savings['total_savings'],
+            'message': spousal_savings['recommendation']
+        }]
+
+    # Medical expense optimization
+    def medical_expense_opportunities(self, tax_return):
+        if tax_return.household is None:
+            return []
+        medical_savings = self.optimize_medical_expenses(tax_return)
+        if medical_savings['additional_refund'] <= 0:
+            return []
+        claimant = "the lower-income spouse's" if medical_savings['better_on_lower_income'] else "the higher-income spouse's"
+        return [{
+            'type': 'MEDICAL_EXPENSES',
+            'savings': medical_savings['additional_refund'],
+            'message': f"Claiming all ${medical_savings['amount']:,.0f} of medical expenses on {claimant} return would increase your refund"
+        }]
+
+    # Donation carry-forward
+    def donation_carryforward_opportunities(self, tax_return):
+        if tax_return.charitable_donations <= 200:
+            return []
+        donation_analysis = self.analyze_donation_carryforward(tax_return)
+        if not donation_analysis.get('should_carry_forward', False):
+            return []
+        return [{
+            'type': 'DONATION_CARRYFORWARD',
+            'savings': donation_analysis['future_savings'],
+            'message': "Carrying forward part of your donations to next year would maximize tax savings"
+        }]
+
+    # Donation placement between spouses
+    def donation_pooling_opportunities(self, tax_return):
+        plan = tax_return.household
+        if plan is None or plan['donation_savings'] <= 0:
+            return []
+        share = plan['donation_share']
+        donations = tax_return.charitable_donations + tax_return.spouse_return.charitable_donations
+        return [{
+            'type': 'DONATION_POOLING',
+            'savings': plan['donation_savings'],
+            'message': f"Claiming ${donations * share:,.0f} of the household's donations on your return "
+                       f"and ${donations * (1 - share):,.0f} on your spouse's would increase your refund"
+        }]
+
+    # Pension splitting (for seniors); finds nothing while household.SPLIT_PENSION is off
+    def pension_splitting_opportunities(self, tax_return):
+        if tax_return.household is None:
+            return []
+        pension_savings = self.analyze_pension_splitting(tax_return, tax_return.spouse_return)
+        return [pension_savings] if pension_savings.get('savings', 0) > 0 else []
+
+    # Home Buyers' Plan (HBP) repayment
+    def hbp_repayment_opportunities(self, tax_return):
+        if not tax_return.has_hbp_balance:
+            return []
+        hbp_analysis = self.analyze_hbp_repayment(tax_return)
+        return [hbp_analysis] if hbp_analysis.get('should_repay_more', False) else []
+    
+    def build_tax_return(self, base_result, tax_year, profile, slips, spouse=None):
+        if spouse is None:
+            return TaxReturnHelper(base_result, tax_year, profile, slips)
+        spouse_result, spouse_profile, spouse_slips = spouse
+        spouse_return = TaxReturnHelper(spouse_result, tax_year, spouse_profile, spouse_slips)
+        return TaxReturnHelper(base_result, tax_year, profile, slips, spouse_return)
+
+    def optimize_household(self, tax_return):
+        return optimize_household(self.rates.for_year(tax_return.tax_year), tax_return, tax_return.spouse_return)
     
     def should_contribute_to_rrsp(self, tax_return):
         return tax_return.rrsp_deduction_limit > 0 and tax_return.taxable_income > 50000
     
-    def calculate_marginal_tax_rate(self, income):
-        if income > 246752: return 0.53
-        if income > 173205: return 0.48
-        if income > 111733: return 0.43
-        if income > 55867: return 0.30
-        return 0.20
-        
     def project_future_income(self, tax_return):
         # Simplified compound growth
         return tax_return.taxable_income * 1.05
@@ -112,38 +313,125 @@ class OptimizationEngine:
         return contribution * 0.05
         
     def analyze_spousal_attribution(self, tax_return, spouse_return):
-        return {'total_savings': 0, 'recommendation': ''}
+        """
+        Tax saved by having the lower-income spouse earn the higher earner's
+        investment income, e.g. through a prescribed-rate spousal loan, on
+        top of the household plan. Loan interest is not netted off.
+        """
+        plan = tax_return.household
+        if spouse_return is None or plan is None:
+            return {'total_savings': 0, 'recommendation': ''}
+        if tax_return.taxable_income >= spouse_return.taxable_income:
+            amount = tax_return.investment_income
+        else:
+            amount = -spouse_return.investment_income
+        if amount == 0:
+            return {'total_savings': 0, 'recommendation': ''}
+        shift = income_shift_savings(self.rates.for_year(tax_return.tax_year), tax_return, spouse_return, plan, amount)
+        earner = "your spouse" if amount > 0 else "you"
+        return {
+            'total_savings': shift['savings'],
+            'amount': abs(shift['shift']),
+            'recommendation': f"Having {earner} earn ${abs(shift['shift']):,.0f} of the household's investment income, "
+                              f"funded by a prescribed-rate spousal loan to avoid attribution, would save "
+                              f"${shift['savings']:,.0f} before loan interest",
+        }
         
     def optimize_medical_expenses(self, tax_return):
-        return {'better_on_lower_income': True, 'additional_refund': 250}
+        plan = tax_return.household
+        if plan is None:
+            return {'better_on_lower_income': False, 'additional_refund': 0, 'amount': 0}
+        spouse_return = tax_return.spouse_return
+        # medical_share is the part claimed on this return
+        on_this_return = plan['medical_share'] >= 0.5
+        primary_is_lower = tax_return.net_income - plan['pension_shift'] <= spouse_return.net_income + plan['pension_shift']
+        return {
+            'better_on_lower_income': on_this_return == primary_is_lower,
+            'additional_refund': plan['medical_savings'],
+            'amount': tax_return.total_medical_expenses + spouse_return.total_medical_expenses,
+        }
         
     def analyze_donation_carryforward(self, tax_return):
         return {'should_carry_forward': True, 'future_savings': 100}
         
     def analyze_pension_splitting(self, tax_return, spouse_return):
-        return {'type': 'PENSION_SPLITTING', 'savings': 0, 'message': ''}
+        plan = tax_return.household
+        if spouse_return is None or plan is None or plan['pension_savings'] <= 0:
+            return {'type': 'PENSION_SPLITTING', 'savings': 0, 'message': ''}
+        shift = plan['pension_shift']
+        pension = eligible_pension(tax_return if shift > 0 else spouse_return)
+        direction = "your pension income to your spouse" if shift > 0 else "your spouse's pension income to you"
+        return {
+            'type': 'PENSION_SPLITTING',
+            'savings': plan['pension_savings'],
+            'amount': abs(shift),
+            'message': f"Allocating ${abs(shift):,.0f} ({abs(shift) / pension:.0%}) of {direction} would save "
+                       f"${plan['pension_savings']:,.0f}",
+        }
         
     def analyze_hbp_repayment(self, tax_return):
         return {'type': 'HBP_REPAYMENT', 'should_repay_more': False, 'savings': 0, 'message': ''}
         
-    def calculate_optimal_rrsp_contribution(self, tax_return):
+    def rrsp_savings_curve(self, tax_return):
         """
-        Complex RRSP optimization with multi-year projections
+        Exact refund increase for RRSP contributions from 0 up to the deduction
+        limit. Federal tax is piecewise linear in taxable income, so the curve
+        is fully described by its values at the contributions that move taxable
+        income onto a bracket threshold (or to zero), and is linear in between.
         """
-        current_marginal_rate = self.calculate_marginal_tax_rate(tax_return.taxable_income)
-        future_income = self.project_future_income(tax_return)
-        future_marginal_rate = self.calculate_marginal_tax_rate(future_income)
-        available_room = tax_return.rrsp_deduction_limit
-        
-        if current_marginal_rate > future_marginal_rate * 1.05:  # Slightly modified
-            optimal = min(available_room, tax_return.available_cash * 0.3)
-            tax_savings = optimal * current_marginal_rate
-            ccb_impact = self.calculate_ccb_impact(tax_return, optimal)
-            return {
-                'amount': optimal,
-                'tax_savings': tax_savings - ccb_impact,
-                'future_tax_cost': optimal * future_marginal_rate * 0.7,
-                'net_lifetime_benefit': (tax_savings - ccb_impact) - (optimal * future_marginal_rate * 0.7)
+        brackets = self.rates.for_year(tax_return.tax_year).federal
+        taxable = max(0.0, tax_return.taxable_income)
+        limit = max(0.0, tax_return.rrsp_deduction_limit)
+        base_tax = brackets.tax(taxable)
+
+        contributions = {0.0, limit, min(taxable, limit)}
+        for threshold in brackets.thresholds:
+            if 0 < taxable - threshold < limit:
+                contributions.add(taxable - threshold)
+
+        return [
+            {
+                'contribution': contribution,
+                'tax_savings': base_tax - brackets.tax(max(0.0, taxable - contribution)),
             }
-        else:
-            return {'amount': 0, 'tax_savings': 0}
+            for contribution in sorted(contributions)
+        ]
+
+    def calculate_optimal_rrsp_contribution(self, tax_return):
+        """
+        Picks the contribution with the best net lifetime benefit: refund now,
+        less the CCB clawback and the tax on withdrawal at the projected future
+        rate. All three are linear between the breakpoints of the savings
+        curve, so the optimum is one of the breakpoints (or the cash cap).
+        """
+        rules = self.rates.for_year(tax_return.tax_year)
+        taxable = max(0.0, tax_return.taxable_income)
+        curve = self.rrsp_savings_curve(tax_return)
+        future_marginal_rate = rules.federal.marginal_rate(self.project_future_income(tax_return))
+        cap = max(0.0, min(tax_return.rrsp_deduction_limit, tax_return.available_cash))
+
+        candidates = [point for point in curve if point['contribution'] <= cap]
+        if cap not in {point['contribution'] for point in candidates}:
+            base_tax = rules.federal.tax(taxable)
+            candidates.append({
+                'contribution': cap,
+                'tax_savings': base_tax - rules.federal.tax(max(0.0, taxable - cap)),
+            })
+
+        best = {'amount': 0, 'tax_savings': 0, 'curve': curve}
+        best_benefit = 0.0
+        for point in candidates:
+            amount = point['contribution']
+            ccb_impact = self.calculate_ccb_impact(tax_return, amount)
+            future_tax_cost = amount * future_marginal_rate * 0.7
+            net_lifetime_benefit = (point['tax_savings'] - ccb_impact) - future_tax_cost
+            if net_lifetime_benefit > best_benefit:
+                best_benefit = net_lifetime_benefit
+                best = {
+                    'amount': amount,
+                    'tax_savings': point['tax_savings'] - ccb_impact,
+                    'future_tax_cost': future_tax_cost,
+                    'net_lifetime_benefit': net_lifetime_benefit,
+                    'curve': curve,
+                }
+        return best
@@ -0,0 +1,46 @@
+from typing import Callable
+import cProfile
+import os
+import random
+import time
+import uuid
+
+class SampledProfiler:
+    """
+    Runs a random `sample_rate` share of engine jobs under cProfile and
+    keeps the `keep` slowest of them as .prof files in `directory`; open
+    them with pstats or snakeviz. Samples faster than `min_seconds` are
+    discarded. File names start with the duration in milliseconds, so the
+    slowest sort last.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 0.01, keep: int = 20, min_seconds: float = 0.0):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.min_seconds = min_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def run(self, label: str, func: Callable, *args):
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profiler.runcall(func, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.min_seconds:
+                self._save(label, elapsed, profiler)
+
+    def _save(self, label: str, elapsed: float, profiler: cProfile.Profile):
+        name = f"{elapsed * 1000:012.3f}ms-{label}-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof"
+        profiler.dump_stats(os.path.join(self.directory, name))
+        profiles = sorted(entry for entry in os.listdir(self.directory) if entry.endswith(".prof"))
+        # Several workers may prune at once
+        for entry in profiles[:max(0, len(profiles) - self.keep)]:
+            try:
+                os.remove(os.path.join(self.directory, entry))
+            except FileNotFoundError:
+                pass
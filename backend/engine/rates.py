@@ -0,0 +1,133 @@
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+class TaxBrackets:
+    """
+    A progressive rate schedule with the tax owed at each bracket threshold
+    precomputed, so tax and marginal-rate lookups are a single bisect.
+    Income exactly on a threshold is taxed in the lower bracket.
+    """
+    __slots__ = ("thresholds", "rates", "cumulative", "_thresholds_array", "_rates_array", "_cumulative_array")
+
+    def __init__(self, brackets: List[Tuple[float, float]]):
+        # brackets: [(lower threshold, rate)], the first threshold being 0
+        self.thresholds = [float(threshold) for threshold, _ in brackets]
+        self.rates = [rate for _, rate in brackets]
+        cumulative = [0.0]
+        for i in range(1, len(brackets)):
+            cumulative.append(cumulative[-1] + (self.thresholds[i] - self.thresholds[i - 1]) * self.rates[i - 1])
+        self.cumulative = cumulative
+        self._thresholds_array = np.array(self.thresholds)
+        self._rates_array = np.array(self.rates)
+        self._cumulative_array = np.array(self.cumulative)
+
+    def bracket_index(self, income: float) -> int:
+        return max(bisect_left(self.thresholds, income) - 1, 0)
+
+    def tax(self, income: float) -> float:
+        i = self.bracket_index(income)
+        return self.cumulative[i] + (income - self.thresholds[i]) * self.rates[i]
+
+    def marginal_rate(self, income: float) -> float:
+        return self.rates[self.bracket_index(income)]
+
+    def bracket_indices(self, incomes: np.ndarray) -> np.ndarray:
+        return np.maximum(np.searchsorted(self._thresholds_array, incomes, side="left") - 1, 0)
+
+    def tax_array(self, incomes: np.ndarray) -> np.ndarray:
+        """
+        Column-wise tax(); gives exactly the same floats as the scalar form.
+        """
+        i = self.bracket_indices(incomes)
+        return self._cumulative_array[i] + (incomes - self._thresholds_array[i]) * self._rates_array[i]
+
+    def marginal_rate_array(self, incomes: np.ndarray) -> np.ndarray:
+        return self._rates_array[self.bracket_indices(incomes)]
+
+class TaxYearRules:
+    """
+    The rates and limits for one tax year.
+    """
+
+    def __init__(self, year: int, config: Dict):
+        self.year = year
+        self.federal = TaxBrackets(config["federal_brackets"])
+        self.cpp_max_employee = config["cpp_max_employee"]
+        self.ei_max_employee = config["ei_max_employee"]
+        self.age_amount_max = config["age_amount_max"]
+        self.age_amount_threshold = config["age_amount_threshold"]
+        self.medical_threshold_rate = config["medical_threshold_rate"]
+        self.medical_threshold_max = config["medical_threshold_max"]
+        # Donation credit: the first donation_low_tier dollars at the lowest
+        # federal rate, the rest at donation_high_rate, or donation_top_rate
+        # to the extent of taxable income in the top bracket.
+        self.donation_low_tier = config["donation_low_tier"]
+        self.donation_high_rate = config["donation_high_rate"]
+        self.donation_top_rate = config["donation_top_rate"]
+        # Share of net income that donations can be claimed against
+        self.donation_income_limit = config["donation_income_limit"]
+
+class RateTables:
+    """
+    Year-indexed TaxYearRules. Years outside the table use the closest
+    year available.
+    """
+
+    def __init__(self, configs: Dict[int, Dict]):
+        self.years = sorted(configs)
+        self._rules = {year: TaxYearRules(year, configs[year]) for year in self.years}
+
+    def for_year(self, tax_year: int) -> TaxYearRules:
+        rules = self._rules.get(tax_year)
+        if rules is None:
+            year = min(max(tax_year, self.years[0]), self.years[-1])
+            rules = self._rules[year]
+        return rules
+
+TAX_YEAR_CONFIG = {
+    2023: {
+        "federal_brackets": [(0, 0.15), (53359, 0.205), (106717, 0.26), (165430, 0.29), (235675, 0.33)],
+        "cpp_max_employee": 3754.45,
+        "ei_max_employee": 1002.45,
+        "age_amount_max": 8396.00,
+        "age_amount_threshold": 42335.00,
+        "medical_threshold_rate": 0.03,
+        "medical_threshold_max": 2635.00,
+        "donation_low_tier": 200.00,
+        "donation_high_rate": 0.29,
+        "donation_top_rate": 0.33,
+        "donation_income_limit": 0.75,
+    },
+    2024: {
+        "federal_brackets": [(0, 0.15), (55867, 0.205), (111733, 0.26), (173205, 0.29), (246752, 0.33)],
+        "cpp_max_employee": 3867.50,
+        "ei_max_employee": 1049.12,
+        "age_amount_max": 8790.00,
+        "age_amount_threshold": 44325.00,
+        "medical_threshold_rate": 0.03,
+        "medical_threshold_max": 2759.00,
+        "donation_low_tier": 200.00,
+        "donation_high_rate": 0.29,
+        "donation_top_rate": 0.33,
+        "donation_income_limit": 0.75,
+    },
+    2025: {
+        # Lowest rate cut from 15% to 14% on July 1, 2025: 14.5% blended
+        "federal_brackets": [(0, 0.145), (57375, 0.205), (114750, 0.26), (177882, 0.29), (253414, 0.33)],
+        "cpp_max_employee": 4034.10,
+        "ei_max_employee": 1077.48,
+        "age_amount_max": 9028.00,
+        "age_amount_threshold": 45522.00,
+        "medical_threshold_rate": 0.03,
+        "medical_threshold_max": 2834.00,
+        "donation_low_tier": 200.00,
+        "donation_high_rate": 0.29,
+        "donation_top_rate": 0.33,
+        "donation_income_limit": 0.75,
+    },
+}
+
+# Built once at import and shared by the engine, optimizer and recovery service
+RATE_TABLES = RateTables(TAX_YEAR_CONFIG)
@@ -1,81 +1,246 @@
+from typing import Any, Callable, Dict, List, Tuple
+import threading
+import time
+
+import numpy as np
+
+from engine.rates import RATE_TABLES
+
+class SanityRule:
+    """
+    One declarative consistency check.
+
+    `inputs` names the values the rule reads; a return missing any of them,
+    or giving a non-numeric one, is skipped. `condition(limits, values)` is true for a failing return and
+    uses only operators, abs() and NumPy ufuncs, so the same function runs
+    on floats for one return and on NumPy columns for a batch. `detail`
+    builds the message fields of one failing return. `limits` is the
+    TaxYearRules of the return's tax year.
+    """
+    __slots__ = ("rule_id", "severity", "inputs", "condition", "detail")
+
+    def __init__(self, rule_id: str, severity: str, inputs: Tuple[str, ...], condition: Callable, detail: Callable):
+        self.rule_id = rule_id
+        self.severity = severity
+        self.inputs = tuple(inputs)
+        self.condition = condition
+        self.detail = detail
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+def _age_amount(limits, net_income):
+    return np.maximum(0.0, limits.age_amount_max - (net_income - limits.age_amount_threshold) * 0.15)
+
+def _income_parts(values):
+    return (
+        values["employment_income"]
+        + values["self_employment_income"]
+        + values["investment_income"]
+        + values["other_income"]
+    )
+
+SANITY_RULES = (
+    # Rounding consistency (CRA is specific about rounding, tolerates 1 cent)
+    SanityRule(
+        "total_income_parts", "ERROR",
+        ("total_income", "employment_income", "self_employment_income", "investment_income", "other_income"),
+        lambda limits, v: abs(_income_parts(v) - v["total_income"]) > 0.01,
+        lambda limits, v: {
+            "message": "Total income does not match sum of parts",
+            "difference": _income_parts(v) - v["total_income"],
+        },
+    ),
+    # CPP contributions, allowing 1 cent rounding
+    SanityRule(
+        "cpp_maximum", "ERROR", ("cpp_contributions",),
+        lambda limits, v: v["cpp_contributions"] > limits.cpp_max_employee + 0.01,
+        lambda limits, v: {
+            "message": f"CPP contributions exceed maximum of ${limits.cpp_max_employee:,.2f}",
+            "excess": v["cpp_contributions"] - limits.cpp_max_employee,
+        },
+    ),
+    SanityRule(
+        "ei_maximum", "ERROR", ("ei_contributions",),
+        lambda limits, v: v["ei_contributions"] > limits.ei_max_employee + 0.01,
+        lambda limits, v: {"message": f"EI contributions exceed maximum of ${limits.ei_max_employee:,.2f}"},
+    ),
+    # Age amount phases out above the income threshold
+    SanityRule(
+        "age_amount", "WARNING", ("age", "claimed_age_amount", "net_income"),
+        lambda limits, v: (
+            (v["age"] >= 65)
+            & (v["net_income"] > limits.age_amount_threshold)
+            & (abs(v["claimed_age_amount"] - _age_amount(limits, v["net_income"])) > 1.00)
+        ),
+        lambda limits, v: {
+            "message": "Age amount may be incorrect",
+            "calculated": float(_age_amount(limits, v["net_income"])),
+            "claimed": v["claimed_age_amount"],
+        },
+    ),
+    # Medical expenses below the 3% of net income threshold
+    SanityRule(
+        "medical_threshold", "INFO", ("medical_expenses", "net_income"),
+        lambda limits, v: (v["medical_expenses"] > 0) & (v["medical_expenses"] < v["net_income"] * limits.medical_threshold_rate),
+        lambda limits, v: {
+            "message": f"Medical expenses below ${v['net_income'] * limits.medical_threshold_rate:,.2f} threshold - no benefit",
+        },
+    ),
+)
+
 class TaxCalculationRecoveryService:
     """
     Handles edge cases and calculation errors gracefully
     """
-    
+
+    def __init__(self, rates=None, rules=None):
+        self.rates = rates or RATE_TABLES
+        self.rules = list(SANITY_RULES if rules is None else rules)
+        # rule_id -> [runs, returns checked, returns skipped, seconds]
+        self._timings = {rule.rule_id: [0, 0, 0, 0.0] for rule in self.rules}
+        self._timings_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_timings_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._timings_lock = threading.Lock()
+
     def get_max_cpp_employee(self, year):
-        return 3867.50 if year >= 2024 else 3754.45
+        return self.rates.for_year(year).cpp_max_employee
 
     def get_max_ei_employee(self, year):
-        return 1049.12 if year >= 2024 else 1002.45
-        
+        return self.rates.for_year(year).ei_max_employee
+
     def get_max_age_amount(self, year):
-        return 8790.00
-        
+        return self.rates.for_year(year).age_amount_max
+
     def get_age_amount_threshold(self, year):
-        return 44325.00
-        
-    def calculate_age_amount(self, income):
-        return max(0, self.get_max_age_amount(2025) - ((income - self.get_age_amount_threshold(2025)) * 0.15))
+        return self.rates.for_year(year).age_amount_threshold
+
+    def calculate_age_amount(self, income, year):
+        return max(0, self.get_max_age_amount(year) - ((income - self.get_age_amount_threshold(year)) * 0.15))
+
+    def register_rule(self, rule: SanityRule):
+        """
+        Adds a rule, or replaces the one with the same rule_id. Failures are
+        reported in registration order.
+        """
+        for i, existing in enumerate(self.rules):
+            if existing.rule_id == rule.rule_id:
+                self.rules[i] = rule
+                break
+        else:
+            self.rules.append(rule)
+        with self._timings_lock:
+            self._timings[rule.rule_id] = [0, 0, 0, 0.0]
+
+    def run_checks(self, tax_year: int, inputs: Dict[str, Any]) -> List[Dict]:
+        """
+        Runs every rule over one return's inputs.
+        """
+        outcomes = self.run_rules(tax_year, inputs)
+        return [outcomes[rule.rule_id] for rule in self.rules if outcomes[rule.rule_id] is not None]
+
+    def run_rules(self, tax_year: int, inputs: Dict[str, Any], rule_ids=None) -> Dict[str, Any]:
+        """
+        Runs the rules named in `rule_ids` (all of them by default) over one
+        return's inputs. Returns each rule's check keyed by rule_id, or None
+        for a rule that passed or was skipped.
+        """
+        limits = self.rates.for_year(tax_year)
+        outcomes = {}
+        timings = []
+        for rule in self.rules:
+            if rule_ids is not None and rule.rule_id not in rule_ids:
+                continue
+            outcomes[rule.rule_id] = None
+            if not all(is_number(inputs.get(name)) for name in rule.inputs):
+                timings.append((rule.rule_id, 0, 1, 0.0))
+                continue
+            start = time.perf_counter()
+            if rule.condition(limits, inputs):
+                outcomes[rule.rule_id] = {"severity": rule.severity, **rule.detail(limits, inputs)}
+            timings.append((rule.rule_id, 1, 0, time.perf_counter() - start))
+        self._record(timings)
+        return outcomes
+
+    def run_checks_batch(self, tax_year: int, inputs: List[Dict[str, Any]]) -> List[List[Dict]]:
+        """
+        Runs every rule once over NumPy columns of many returns' inputs.
+        Each return's checks match run_checks() for that return.
+        """
+        count = len(inputs)
+        results = [[] for _ in range(count)]
+        if not count:
+            return results
+        limits = self.rates.for_year(tax_year)
+        columns = {}
+        timings = []
+        for rule in self.rules:
+            start = time.perf_counter()
+            present = np.ones(count, dtype=bool)
+            for name in rule.inputs:
+                if name not in columns:
+                    columns[name] = self._column(name, inputs)
+                if columns[name] is None:
+                    present[:] = False
+                    break
+                present &= columns[name][1]
+            if not present.any():
+                timings.append((rule.rule_id, 0, count, 0.0))
+                continue
+            failing = rule.condition(limits, {name: columns[name][0] for name in rule.inputs})
+            for i in np.flatnonzero(failing & present).tolist():
+                results[i].append({"severity": rule.severity, **rule.detail(limits, inputs[i])})
+            checked = int(present.sum())
+            timings.append((rule.rule_id, checked, count - checked, time.perf_counter() - start))
+        self._record(timings)
+        return results
+
+    @staticmethod
+    def _column(name: str, inputs: List[Dict[str, Any]]):
+        # (float64 values, present mask), or None when no return has a
+        # numeric value for the input
+        raw = [values.get(name) for values in inputs]
+        present = np.array([is_number(value) for value in raw], dtype=bool)
+        if not present.any():
+            return None
+        column = np.array([value if ok else np.nan for value, ok in zip(raw, present.tolist())], dtype=float)
+        return column, present
+
+    def _record(self, timings):
+        with self._timings_lock:
+            for rule_id, checked, skipped, seconds in timings:
+                timing = self._timings.setdefault(rule_id, [0, 0, 0, 0.0])
+                timing[0] += 1
+                timing[1] += checked
+                timing[2] += skipped
+                timing[3] += seconds
+
+    def rule_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._timings_lock:
+            timings = {rule_id: list(timing) for rule_id, timing in self._timings.items()}
+        stats = {}
+        for rule in self.rules:
+            runs, checked, skipped, seconds = timings.get(rule.rule_id, [0, 0, 0, 0.0])
+            stats[rule.rule_id] = {
+                "severity": rule.severity,
+                "runs": runs,
+                "returns_checked": checked,
+                "returns_skipped": skipped,
+                "seconds": seconds,
+            }
+        return stats
 
     def validate_calculation_consistency(self, tax_return):
         """
-        Run 100+ sanity checks on calculations
+        Runs the sanity rules over a tax return object exposing the rule
+        inputs as attributes.
         """
-        checks = []
-        
-        # Check 1: Rounding consistency (CRA is specific about rounding)
-        total_from_parts = (
-            tax_return.employment_income +
-            tax_return.self_employment_income +
-            tax_return.investment_income +
-            tax_return.other_income
-        )
-        if abs(total_from_parts - tax_return.total_income) > 0.01:  # CRA tolerates 1 cent
-            checks.append({
-                'severity': 'ERROR',
-                'message': 'Total income does not match sum of parts',
-                'difference': total_from_parts - tax_return.total_income
-            })
-            
-        # Check 2: CPP contributions consistency
-        max_cpp_employee = self.get_max_cpp_employee(tax_return.tax_year)
-        if tax_return.cpp_contributions > max_cpp_employee + 0.01:  # Allow 1 cent rounding
-            checks.append({
-                'severity': 'ERROR',
-                'message': f'CPP contributions exceed maximum of ${max_cpp_employee:,.2f}',
-                'excess': tax_return.cpp_contributions - max_cpp_employee
-            })
-            
-        # Check 3: EI contributions consistency
-        max_ei_employee = self.get_max_ei_employee(tax_return.tax_year)
-        if tax_return.ei_contributions > max_ei_employee + 0.01:
-            checks.append({
-                'severity': 'ERROR',
-                'message': f'EI contributions exceed maximum of ${max_ei_employee:,.2f}'
-            })
-            
-        # Check 4: Age amount eligibility
-        if tax_return.age >= 65:
-            max_age_amount = self.get_max_age_amount(tax_return.tax_year)
-            if tax_return.claiming_age_amount and tax_return.income > self.get_age_amount_threshold(tax_return.tax_year):
-                # Age amount phases out
-                expected_age_amount = self.calculate_age_amount(tax_return.income)
-                if abs(tax_return.age_amount - expected_age_amount) > 1.00:
-                    checks.append({
-                        'severity': 'WARNING',
-                        'message': 'Age amount may be incorrect',
-                        'calculated': expected_age_amount,
-                        'claimed': tax_return.age_amount
-                    })
-                    
-        # Check 5: Medical expense threshold
-        if tax_return.medical_expenses > 0:
-            threshold = tax_return.net_income * 0.03  # 3% threshold
-            if tax_return.medical_expenses < threshold:
-                checks.append({
-                    'severity': 'INFO',
-                    'message': f'Medical expenses below ${threshold:,.2f} threshold - no benefit'
-                })
-                
-        return checks
+        inputs = {name: getattr(tax_return, name, None) for rule in self.rules for name in rule.inputs}
+        return self.run_checks(tax_return.tax_year, inputs)
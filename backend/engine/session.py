@@ -0,0 +1,192 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import threading
+import time
+import uuid
+
+from engine.dag import sanity_check_inputs
+from engine.slips import Slip, parse_slips
+
+class CalculationSession:
+    """
+    A return kept evaluated on the server between edits. Slip changes only
+    rebuild the aggregates of the slip types they touch, recompute the DAG
+    nodes downstream of them, and rerun the sanity rules whose inputs
+    changed.
+    """
+
+    def __init__(self, engine, tax_year: int, profile: Dict, slips: List[Slip]):
+        self.session_id = uuid.uuid4().hex
+        self.engine = engine
+        self.tax_year = tax_year
+        self.plan = engine.compile(tax_year)
+        self.profile = profile
+        self.slips = OrderedDict()
+        for slip in parse_slips(slips):
+            self._put_slip(slip)
+        self.values = self.plan.evaluate(profile, list(self.slips.values()))
+        self.check_inputs = sanity_check_inputs(self.values)
+        # rule_id -> the rule's check, or None when it passes
+        self.rule_outcomes = engine.recovery_service.run_rules(tax_year, self.check_inputs)
+        self.values["sanity_checks"] = self._sanity_checks()
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+        # The slips SessionStore has counted for this session; only changed
+        # under the store's lock
+        self.counted_slips = 0
+
+    def _put_slip(self, slip: Slip) -> str:
+        if slip.id is None:
+            slip.id = f"slip-{uuid.uuid4().hex[:12]}"
+        self.slips[str(slip.id)] = slip
+        return str(slip.id)
+
+    @property
+    def slip_count(self) -> int:
+        return len(self.slips)
+
+    def _sanity_checks(self) -> List[Dict]:
+        # In rule order, as run_sanity_checks() reports them
+        outcomes = self.rule_outcomes
+        return [outcomes[rule.rule_id] for rule in self.engine.recovery_service.rules if outcomes.get(rule.rule_id) is not None]
+
+    def _rerun_sanity_checks(self) -> List[Dict]:
+        """
+        Reruns only the rules reading an input whose value changed, and rules
+        registered since the last run.
+        """
+        inputs = sanity_check_inputs(self.values)
+        changed = {name for name in inputs.keys() | self.check_inputs.keys() if inputs.get(name) != self.check_inputs.get(name)}
+        self.check_inputs = inputs
+        rule_ids = {
+            rule.rule_id for rule in self.engine.recovery_service.rules
+            if rule.rule_id not in self.rule_outcomes or not changed.isdisjoint(rule.inputs)
+        }
+        if rule_ids:
+            self.rule_outcomes.update(self.engine.recovery_service.run_rules(self.tax_year, inputs, rule_ids))
+        return self._sanity_checks()
+
+    def apply(self, upsert: List[Slip], remove: List[str]) -> Dict[str, Any]:
+        """
+        Applies slip edits and returns only what changed: the recomputed node
+        values, the rebuilt aggregate buckets, and the sanity checks if their
+        outcome differs.
+        """
+        with self.lock:
+            self.last_used = time.monotonic()
+            touched_types = set()
+            assigned_ids = []
+            for slip_id in remove:
+                slip = self.slips.pop(str(slip_id), None)
+                if slip is not None:
+                    touched_types.add(slip.type)
+            for slip in parse_slips(upsert):
+                previous = self.slips.get(str(slip.id))
+                if previous is not None:
+                    touched_types.add(previous.type)
+                touched_types.add(slip.type)
+                assigned_ids.append(self._put_slip(slip))
+
+            delta = {"session_id": self.session_id, "slip_ids": assigned_ids, "changed": {}}
+            if not touched_types:
+                return delta
+
+            slips = list(self.slips.values())
+            self.values["slips"] = slips
+            slip_totals = self.values["slip_aggregates"]
+            slip_totals.rebuild(touched_types, slips)
+            delta["changed"] = self.plan.propagate(self.values, ["slip_aggregates"])
+            delta["changed"]["slip_aggregates"] = {
+                slip_type: slip_totals.get(slip_type, {}) for slip_type in touched_types
+            }
+
+            sanity_checks = self._rerun_sanity_checks()
+            if sanity_checks != self.values["sanity_checks"]:
+                self.values["sanity_checks"] = sanity_checks
+                delta["sanity_checks"] = sanity_checks
+            return delta
+
+class SessionStore:
+    """
+    Holds calculation sessions in memory. Sessions idle for longer than
+    `idle_ttl` seconds are dropped, and the least recently used ones are
+    evicted once the session or total slip count bounds are exceeded.
+    """
+
+    def __init__(self, engine, max_sessions: int = 1000, max_slips: int = 200000, idle_ttl: float = 1800.0):
+        self.engine = engine
+        self.max_sessions = max_sessions
+        self.max_slips = max_slips
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._slip_count = 0
+        self._lock = threading.Lock()
+
+    def create(self, tax_year: int, profile: Dict, slips: List[Slip]) -> CalculationSession:
+        session = CalculationSession(self.engine, tax_year, profile, slips)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._recount(session)
+            self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[CalculationSession]:
+        with self._lock:
+            return self._touch(session_id)
+
+    def _touch(self, session_id: str) -> Optional[CalculationSession]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if time.monotonic() - session.last_used > self.idle_ttl:
+            self._drop(session_id)
+            return None
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def update(self, session_id: str, upsert: List[Slip], remove: List[str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._touch(session_id)
+        if session is None:
+            return None
+        # Under the session's own lock, so edits to other sessions and
+        # reads of the store don't wait for this one
+        delta = session.apply(upsert, remove)
+        with self._lock:
+            # A session dropped meanwhile took its counted slips with it
+            if self._sessions.get(session_id) is session:
+                self._recount(session)
+                self._evict()
+        return delta
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._drop(session_id)
+
+    def _drop(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._slip_count -= session.counted_slips
+        session.counted_slips = 0
+        return True
+
+    def _recount(self, session: CalculationSession):
+        count = session.slip_count
+        self._slip_count += count - session.counted_slips
+        session.counted_slips = count
+
+    def _evict(self):
+        # Oldest sessions are at the front of the OrderedDict
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_used <= self.idle_ttl:
+                break
+            self._drop(session_id)
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._slip_count > self.max_slips):
+            self._drop(next(iter(self._sessions)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "slips": self._slip_count}
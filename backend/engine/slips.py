@@ -0,0 +1,188 @@
+from typing import Any, Dict, Iterable, List
+import math
+
+def _amount(value) -> float:
+    if value is None:
+        return 0.0
+    if isinstance(value, bool):
+        raise ValueError(f"Expected an amount, got {value!r}")
+    try:
+        amount = float(value)
+    except TypeError:
+        # Lists and objects: a ValueError so request validation reports it
+        raise ValueError(f"Expected an amount, got {value!r}") from None
+    # "nan", "inf" and overflowing numbers like 1e400
+    if not math.isfinite(amount):
+        raise ValueError(f"Expected a finite amount, got {value!r}")
+    return amount
+
+def _is_amount(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _kept(values: Dict[str, Any]) -> Dict[str, Any]:
+    # Unmodelled values are kept as sent, but a NaN or Infinity would still
+    # be aggregated and echoed, so it is rejected like a modelled amount
+    for key, value in values.items():
+        if isinstance(value, float) and not math.isfinite(value):
+            raise ValueError(f"Expected a finite amount for {key!r}, got {value!r}")
+    return values
+
+class Slip:
+    """
+    Base of the typed slips. The amounts the engine reads live in __slots__
+    attributes as floats, parsed once from the request. Boxes and fields the
+    engine doesn't model are kept aside, and `supplied` records which
+    modelled ones the request gave, so the slip round-trips through
+    to_dict(): absent boxes read as 0.0 but are not echoed back.
+    """
+    __slots__ = ("id", "supplied", "extra_boxes", "extra_fields")
+    type = None
+    # (box number, attribute) pairs read from "boxes"
+    BOXES = ()
+    # (field name, attribute) pairs read from the top level of the slip
+    FIELDS = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Slip":
+        slip = cls.__new__(cls)
+        slip.id = data.get("id")
+        boxes = data.get("boxes") or {}
+        if not isinstance(boxes, dict):
+            raise ValueError("Slip boxes must be an object")
+        for box, attribute in cls.BOXES:
+            setattr(slip, attribute, _amount(boxes.get(box)))
+        for field, attribute in cls.FIELDS:
+            setattr(slip, attribute, _amount(data.get(field)))
+        slip.supplied = frozenset(
+            [box for box, _ in cls.BOXES if box in boxes] + [field for field, _ in cls.FIELDS if field in data]
+        )
+        slip.extra_boxes = _kept({box: value for box, value in boxes.items() if box not in cls._box_names}) or None
+        slip.extra_fields = _kept({key: value for key, value in data.items() if key not in cls._field_names}) or None
+        return slip
+
+    def amounts(self) -> Iterable:
+        """
+        (key, amount) pairs to aggregate: modelled boxes and fields, then any
+        other numeric boxes.
+        """
+        for key, attribute in self._amount_keys:
+            yield key, getattr(self, attribute)
+        if self.extra_boxes:
+            for box, value in self.extra_boxes.items():
+                if _is_amount(value):
+                    yield box, value
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dict(self.extra_fields) if self.extra_fields else {}
+        if self.id is not None:
+            data["id"] = self.id
+        data["type"] = self.type
+        supplied = self.supplied
+        boxes = {box: getattr(self, attribute) for box, attribute in self.BOXES if box in supplied}
+        if self.extra_boxes:
+            boxes.update(self.extra_boxes)
+        if boxes:
+            data["boxes"] = boxes
+        for field, attribute in self.FIELDS:
+            if field in supplied:
+                data[field] = getattr(self, attribute)
+        return data
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._box_names = frozenset(box for box, _ in cls.BOXES)
+        cls._field_names = frozenset({"id", "type", "boxes"} | {field for field, _ in cls.FIELDS})
+        cls._amount_keys = tuple(cls.BOXES) + tuple(cls.FIELDS)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class T4Slip(Slip):
+    __slots__ = ("employment_income", "cpp_contributions", "ei_premiums", "income_tax_deducted")
+    type = "T4"
+    BOXES = (
+        ("14", "employment_income"),
+        ("16", "cpp_contributions"),
+        ("18", "ei_premiums"),
+        ("22", "income_tax_deducted"),
+    )
+
+class T4ASlip(Slip):
+    __slots__ = ("pension", "income_tax_deducted", "other_income")
+    type = "T4A"
+    BOXES = (
+        ("16", "pension"),
+        ("22", "income_tax_deducted"),
+        ("28", "other_income"),
+    )
+
+class T5Slip(Slip):
+    __slots__ = ("eligible_dividends",)
+    type = "T5"
+    BOXES = (("24", "eligible_dividends"),)
+
+class T2125Slip(Slip):
+    __slots__ = ("net_income",)
+    type = "T2125"
+    FIELDS = (("netIncome", "net_income"),)
+
+class RRSPSlip(Slip):
+    __slots__ = ("amount",)
+    type = "RRSP"
+    FIELDS = (("amount", "amount"),)
+
+class MedicalSlip(Slip):
+    __slots__ = ("amount",)
+    type = "Medical"
+    FIELDS = (("amount", "amount"),)
+
+class DonationSlip(Slip):
+    __slots__ = ("amount",)
+    type = "Donation"
+    FIELDS = (("amount", "amount"),)
+
+class GenericSlip(Slip):
+    """
+    Any other slip type, kept as its raw boxes and fields.
+    """
+    __slots__ = ("type",)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GenericSlip":
+        slip = super().from_dict(data)
+        slip.type = data.get("type")
+        return slip
+
+    def amounts(self) -> Iterable:
+        yield from super().amounts()
+        # amount and netIncome are aggregated for any slip type
+        if self.extra_fields:
+            for field in ("amount", "netIncome"):
+                value = self.extra_fields.get(field)
+                if _is_amount(value):
+                    yield field, value
+
+SLIP_TYPES = {cls.type: cls for cls in (T4Slip, T4ASlip, T5Slip, T2125Slip, RRSPSlip, MedicalSlip, DonationSlip)}
+
+def parse_slip(data) -> Slip:
+    """
+    Builds the typed slip for a raw slip dict; typed slips pass through.
+    """
+    if isinstance(data, Slip):
+        return data
+    if not isinstance(data, dict):
+        raise ValueError("Each slip must be an object")
+    return SLIP_TYPES.get(data.get("type"), GenericSlip).from_dict(data)
+
+def parse_slips(slips) -> List[Slip]:
+    if not isinstance(slips, (list, tuple)):
+        raise ValueError("Slips must be a list")
+    return [parse_slip(slip) for slip in slips]
+
+def encode_slip(obj):
+    """
+    `default` hook for JSON encoders so results that echo slips serialize.
+    """
+    if isinstance(obj, Slip):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
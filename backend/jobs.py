@@ -0,0 +1,46 @@
+"""
+Units of engine work run by the EngineExecutor, in the API process or in a
+pool worker. Each job receives the service singletons as `services`.
+"""
+from engine.dag import compact_result
+
+def calculate(services, tax_year, profile, slips, compact=False, fields=None):
+    result = services["engine"].calculate(tax_year, profile, slips)
+    # Compacted here so a pool worker doesn't ship the inputs back
+    return compact_result(result, fields) if compact or fields else result
+
+def calculate_batch(services, tax_year, returns, compact=False, fields=None):
+    results = services["engine"].calculate_batch(tax_year, returns)
+    if compact or fields:
+        results = [compact_result(result, fields) for result in results]
+    return results
+
+def optimize(services, tax_year, profile, slips, spouse_profile=None, spouse_slips=None):
+    # Calculate base scenario first
+    base_result = services["engine"].calculate(tax_year, profile, slips)
+    # Household mode: both returns are calculated in this job and optimized together
+    spouse = None
+    if spouse_profile is not None:
+        spouse_result = services["engine"].calculate(tax_year, spouse_profile, spouse_slips)
+        spouse = (spouse_result, spouse_profile, spouse_slips)
+    # Get optimization opportunities
+    analysis = services["optimizer"].run_analyzers(base_result, tax_year, profile, slips, spouse)
+    response = {
+        "base_refund": base_result.get("refund_or_balance", 0),
+        "opportunities": analysis["opportunities"],
+        "partial": analysis["partial"]
+    }
+    if spouse is not None:
+        response["spouse_base_refund"] = spouse[0].get("refund_or_balance", 0)
+        response["household"] = analysis["household"]
+    return response
+
+def optimize_rrsp(services, tax_year, profile, slips):
+    optimizer = services["optimizer"]
+    base_result = services["engine"].calculate(tax_year, profile, slips)
+    tax_return = optimizer.build_tax_return(base_result, tax_year, profile, slips)
+    return optimizer.calculate_optimal_rrsp_contribution(tax_return)
+
+def netfile_xml(services, tax_year, profile, slips):
+    result = services["engine"].calculate(tax_year, profile, slips)
+    return services["netfile_service"].generate_xml(result, profile)
@@ -1,13 +1,46 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import os
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, List
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, PlainSerializer, PlainValidator, ValidationError, WithJsonSchema
+from typing import Annotated, Dict, Any, List, Optional
 
+from engine.cache import CalculationCache, SQLiteCacheBackend, calculation_key
 from engine.dag import TaxCalculationEngine
+from engine.executor import EngineExecutor, Overloaded
+from engine.metrics import METRICS
 from engine.optimizer import OptimizationEngine
-from api.netfile import NetfileService
+from engine.profiling import SampledProfiler
+from engine.session import SessionStore
+from engine.slips import Slip, parse_slips
+from api.binary import MsgPackRoute
+from api.metrics import RequestMetricsMiddleware
+from api.netfile import NetfileService, T1XmlWriter
+from api.responses import FastJSONResponse, dumps_line
+from api.submissions import SubmissionQueue, SubmissionStore, scoped_key
+from api.streaming import iter_ndjson_lines, DuplexStreamingResponse, LineTooLongError
+import jobs
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await executor.start()
+    await submission_queue.start()
+    yield
+    await submission_queue.stop()
+    executor.shutdown()
 
-app = FastAPI(title="TaxSimple Engine API", version="1.0.0")
+app = FastAPI(
+    title="TaxSimple Engine API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
+)
+# Request bodies may also be sent as MessagePack (Content-Type: application/msgpack)
+app.router.route_class = MsgPackRoute
 
 # Configure CORS for local React development
 app.add_middleware(
@@ -17,39 +50,315 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
-engine = TaxCalculationEngine()
-optimizer = OptimizationEngine()
+# Results are memoized so /api/calculate -> /api/optimize -> /api/submit on
+# the same payload only computes once. Set TAXSIMPLE_CACHE_DB to share hits
+# between uvicorn workers through a SQLite file.
+cache_db = os.environ.get("TAXSIMPLE_CACHE_DB")
+cache_ttl = os.environ.get("TAXSIMPLE_CACHE_TTL", "300")
+calculation_cache = CalculationCache(
+    max_entries=int(os.environ.get("TAXSIMPLE_CACHE_SIZE", "1024")),
+    ttl=float(cache_ttl) if cache_ttl else None,
+    shared_backend=SQLiteCacheBackend(cache_db) if cache_db else None,
+)
+
+# TAXSIMPLE_INSTRUMENT=1 adds per-node, sanity-check and analyzer timings to /metrics
+instrument = os.environ.get("TAXSIMPLE_INSTRUMENT", "0") == "1"
+engine = TaxCalculationEngine(cache=calculation_cache, instrument=instrument)
+# Analyzers run concurrently; ones that exceed their budget, or that can't
+# get a thread within TAXSIMPLE_ANALYZER_START_BUDGET, are reported as partial
+analyzer_start_budget = os.environ.get("TAXSIMPLE_ANALYZER_START_BUDGET")
+optimizer = OptimizationEngine(
+    default_time_budget=float(os.environ.get("TAXSIMPLE_ANALYZER_BUDGET", "0.5")),
+    max_workers=int(os.environ.get("TAXSIMPLE_ANALYZER_WORKERS", "8")),
+    start_budget=float(analyzer_start_budget) if analyzer_start_budget else None,
+    instrument=instrument,
+)
+sessions = SessionStore(
+    engine,
+    max_sessions=int(os.environ.get("TAXSIMPLE_MAX_SESSIONS", "1000")),
+    max_slips=int(os.environ.get("TAXSIMPLE_MAX_SESSION_SLIPS", "200000")),
+    idle_ttl=float(os.environ.get("TAXSIMPLE_SESSION_IDLE_TTL", "1800")),
+)
 netfile_service = NetfileService()
+# Returns are filed in the background from a durable queue; any process
+# sharing the database file helps drain it
+submission_queue = SubmissionQueue(
+    SubmissionStore(os.environ.get("TAXSIMPLE_SUBMISSION_DB", "netfile_submissions.db")),
+    endpoint=os.environ.get("TAXSIMPLE_NETFILE_URL", "http://127.0.0.1:8900/submit"),
+    workers=int(os.environ.get("TAXSIMPLE_SUBMISSION_WORKERS", "4")),
+    max_attempts=int(os.environ.get("TAXSIMPLE_SUBMISSION_MAX_ATTEMPTS", "8")),
+    timeout=float(os.environ.get("TAXSIMPLE_NETFILE_TIMEOUT", "30")),
+)
+
+# CPU-bound work runs on a thread pool, or with TAXSIMPLE_EXECUTION_MODE=process
+# on worker processes seeded with the singletons above. Requests beyond
+# TAXSIMPLE_MAX_INFLIGHT are shed with 429 rather than queued without bound.
+max_inflight = os.environ.get("TAXSIMPLE_MAX_INFLIGHT")
+# With TAXSIMPLE_PROFILE_DIR set, a sample of engine jobs is profiled and the
+# slowest are kept there as cProfile dumps
+profile_dir = os.environ.get("TAXSIMPLE_PROFILE_DIR")
+profiler = SampledProfiler(
+    profile_dir,
+    sample_rate=float(os.environ.get("TAXSIMPLE_PROFILE_SAMPLE_RATE", "0.01")),
+    keep=int(os.environ.get("TAXSIMPLE_PROFILE_KEEP", "20")),
+    min_seconds=float(os.environ.get("TAXSIMPLE_PROFILE_MIN_SECONDS", "0")),
+) if profile_dir else None
+executor = EngineExecutor(
+    {"engine": engine, "optimizer": optimizer, "netfile_service": netfile_service},
+    mode=os.environ.get("TAXSIMPLE_EXECUTION_MODE", "thread"),
+    workers=int(os.environ.get("TAXSIMPLE_EXECUTION_WORKERS", "0")) or None,
+    max_inflight=int(max_inflight) if max_inflight else None,
+    retry_after=int(os.environ.get("TAXSIMPLE_RETRY_AFTER", "1")),
+    profiler=profiler,
+)
+
+def _service_metrics():
+    # Point-in-time stats of this process's services for /metrics
+    cache = calculation_cache.stats()
+    yield "taxsimple_cache_hits_total", "counter", "Calculation cache hits", {"tier": "memory"}, cache["hits"]
+    yield "taxsimple_cache_hits_total", "counter", "Calculation cache hits", {"tier": "shared"}, cache["shared_hits"]
+    yield "taxsimple_cache_misses_total", "counter", "Calculation cache misses", {}, cache["misses"]
+    yield "taxsimple_cache_entries", "gauge", "Calculation cache entries", {}, cache["entries"]
+    executor_stats = executor.stats()
+    yield "taxsimple_executor_inflight", "gauge", "Engine jobs queued or running", {}, executor_stats["inflight"]
+    yield "taxsimple_executor_max_inflight", "gauge", "Engine job admission limit", {}, executor_stats["max_inflight"]
+    yield "taxsimple_executor_shed_total", "counter", "Requests shed with 429", {}, executor_stats["shed"]
+    session_stats = sessions.stats()
+    yield "taxsimple_sessions", "gauge", "Open calculation sessions", {}, session_stats["sessions"]
+    yield "taxsimple_session_slips", "gauge", "Slips held by calculation sessions", {}, session_stats["slips"]
+    queue_stats = submission_queue.stats()
+    for status, count in sorted(queue_stats["jobs"].items()):
+        yield "taxsimple_submission_jobs", "gauge", "NETFILE submission jobs by status", {"status": status}, count
+    yield "taxsimple_submission_sends_total", "counter", "NETFILE submission attempts sent", {}, queue_stats["sent"]
+    yield "taxsimple_submission_retries_total", "counter", "NETFILE submission attempts retried", {}, queue_stats["retried"]
+
+METRICS.register_collector(_service_metrics)
+
+# Slips are parsed once here into typed slip objects rather than validated
+# as nested Dict[str, Any]
+Slips = Annotated[
+    List[Slip],
+    PlainValidator(parse_slips),
+    PlainSerializer(lambda slips: [slip.to_dict() for slip in slips]),
+    WithJsonSchema({"type": "array", "items": {"type": "object"}}),
+]
 
 class CalculationRequest(BaseModel):
     tax_year: int
     profile: Dict[str, Any]
-    slips: List[Dict[str, Any]]
+    slips: Slips
+
+class ReturnInput(BaseModel):
+    profile: Dict[str, Any]
+    slips: Slips
+
+class OptimizeRequest(CalculationRequest):
+    # The spouse's return; when given, both returns are optimized together
+    spouse: Optional[ReturnInput] = None
+
+class BatchCalculationRequest(BaseModel):
+    tax_year: int
+    returns: List[ReturnInput]
+
+class SlipPatchRequest(BaseModel):
+    # Slips are matched by "id"; slips without one are added as new
+    upsert: Slips = []
+    remove: List[str] = []
+
+def parse_fields(fields: Optional[str]):
+    return [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+# compact=true drops the echoed slips and profile; fields= picks result keys
+CompactQuery = Query(False, description="Return only computed values and sanity checks")
+FieldsQuery = Query(None, description="Comma-separated result keys to return (implies compact)")
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError):
+    # Rendered with orjson: a rejected NaN or Infinity in the echoed input
+    # becomes null instead of failing the 422 itself
+    return FastJSONResponse(status_code=422, content={"detail": jsonable_encoder(exc.errors())})
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "service": "TaxSimple Engine API"}
 
+@app.get("/api/cache/stats")
+def cache_stats():
+    return calculation_cache.stats()
+
+@app.get("/api/executor/stats")
+def executor_stats():
+    return executor.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/sanity-checks/stats")
+def sanity_check_stats():
+    # Per-rule run counts and time spent, for this process's engine
+    return engine.recovery_service.rule_stats()
+
 @app.post("/api/calculate")
-def calculate_return(request: CalculationRequest):
-    result = engine.calculate(request.tax_year, request.profile, request.slips)
-    return result
+async def calculate_return(request: CalculationRequest, compact: bool = CompactQuery, fields: Optional[str] = FieldsQuery):
+    result = await executor.run(
+        jobs.calculate, request.tax_year, request.profile, request.slips, compact, parse_fields(fields)
+    )
+    return FastJSONResponse(result)
+
+@app.post("/api/calculate/batch")
+async def calculate_batch(request: BatchCalculationRequest, compact: bool = CompactQuery, fields: Optional[str] = FieldsQuery):
+    # Evaluated column-wise; each result matches /api/calculate for that return
+    returns = [(r.profile, r.slips) for r in request.returns]
+    results = await executor.run(jobs.calculate_batch, request.tax_year, returns, compact, parse_fields(fields))
+    return FastJSONResponse({"results": results})
+
+@app.post("/api/calculate/stream")
+async def calculate_stream(request: Request, compact: bool = CompactQuery, fields: Optional[str] = FieldsQuery):
+    """
+    Accepts newline-delimited CalculationRequest JSON and streams back one
+    result line per return, in input order, as soon as it is computed.
+    """
+    return DuplexStreamingResponse(
+        _calculate_ndjson(request, compact, parse_fields(fields)), media_type="application/x-ndjson"
+    )
+
+async def _calculate_ndjson(request: Request, compact: bool, fields: Optional[List[str]]):
+    try:
+        async for line_number, line in iter_ndjson_lines(request.stream()):
+            try:
+                calculation = CalculationRequest.model_validate_json(line)
+            except ValidationError as exc:
+                # The raw input (bytes for a non-JSON line) and the exception
+                # objects in ctx don't serialize; loc and msg say enough
+                errors = exc.errors(include_url=False, include_input=False, include_context=False)
+                yield dumps_line({"line": line_number, "error": errors})
+                continue
+            # Wait for a slot instead of shedding: the stream already applies backpressure
+            try:
+                result = await executor.run(
+                    jobs.calculate, calculation.tax_year, calculation.profile, calculation.slips, compact, fields, shed=False
+                )
+            except ValueError as exc:
+                yield dumps_line({"line": line_number, "error": [{"type": "value_error", "loc": [], "msg": str(exc)}]})
+                continue
+            yield dumps_line({"line": line_number, "result": result})
+    except LineTooLongError as exc:
+        yield dumps_line({"error": str(exc)})
+
+@app.post("/api/netfile/batch")
+async def netfile_batch(request: Request):
+    """
+    Accepts newline-delimited CalculationRequest JSON and streams back a
+    single T1ReturnBatch XML document, one return at a time in input order.
+    Lines that fail validation become <RejectedReturn> elements.
+    """
+    return DuplexStreamingResponse(_netfile_batch_xml(request), media_type="application/xml")
+
+# Only the values the T1 XML carries come back from the executor
+NETFILE_FIELDS = ["total_income", "net_income", "taxable_income", "refund_or_balance"]
+
+async def _netfile_batch_xml(request: Request):
+    chunks = []
+    writer = T1XmlWriter(chunks.append, batch=True)
+    writer.start()
+    try:
+        async for line_number, line in iter_ndjson_lines(request.stream()):
+            try:
+                calculation = CalculationRequest.model_validate_json(line)
+            except ValidationError as exc:
+                writer.write_rejected(line_number, "; ".join(
+                    f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors(include_url=False)
+                ))
+            else:
+                result = await executor.run(
+                    jobs.calculate, calculation.tax_year, calculation.profile, calculation.slips, True, NETFILE_FIELDS, shed=False
+                )
+                writer.write_return(result, calculation.profile)
+            yield "".join(chunks)
+            chunks.clear()
+    except LineTooLongError as exc:
+        writer.write_rejected(None, str(exc))
+    writer.close()
+    yield "".join(chunks)
+
+@app.post("/api/sessions")
+def create_session(request: CalculationRequest):
+    session = sessions.create(request.tax_year, request.profile, request.slips)
+    return FastJSONResponse({"session_id": session.session_id, "values": session.values})
+
+@app.get("/api/sessions/{session_id}")
+def get_session(session_id: str):
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return FastJSONResponse({"session_id": session.session_id, "values": session.values})
+
+@app.patch("/api/sessions/{session_id}/slips")
+def patch_session_slips(session_id: str, request: SlipPatchRequest):
+    # Only the nodes affected by the edited slips are recomputed and returned
+    delta = sessions.update(session_id, request.upsert, request.remove)
+    if delta is None:
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return FastJSONResponse(delta)
+
+@app.delete("/api/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return {"status": "deleted"}
 
 @app.post("/api/optimize")
-def optimize_return(request: CalculationRequest):
-    # Calculate base scenario first
-    base_result = engine.calculate(request.tax_year, request.profile, request.slips)
-    # Get optimization opportunities
-    opportunities = optimizer.analyze(base_result, request.tax_year, request.profile, request.slips)
-    return {
-        "base_refund": base_result.get("refund_or_balance", 0),
-        "opportunities": opportunities
-    }
-
-@app.post("/api/submit")
-def submit_netfile(request: CalculationRequest):
-    # In a real scenario, this would generate XML and submit to CRA
-    result = engine.calculate(request.tax_year, request.profile, request.slips)
-    submission_response = netfile_service.submit(result, request.profile)
-    return submission_response
+async def optimize_return(request: OptimizeRequest):
+    spouse = request.spouse
+    return FastJSONResponse(await executor.run(
+        jobs.optimize, request.tax_year, request.profile, request.slips,
+        spouse.profile if spouse else None, spouse.slips if spouse else None,
+    ))
+
+@app.post("/api/optimize/rrsp")
+async def optimize_rrsp(request: CalculationRequest):
+    # Optimal contribution plus the exact contribution-vs-refund curve
+    return FastJSONResponse(await executor.run(jobs.optimize_rrsp, request.tax_year, request.profile, request.slips))
+
+@app.post("/api/submit", status_code=202)
+async def submit_netfile(request: CalculationRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Queues the return for NETFILE and returns the job straight away; poll
+    /api/submissions/{job_id} for the outcome. Resubmitting with the same
+    Idempotency-Key (by default, the same return) returns the existing job,
+    unless that job failed: then the return is queued again. Client keys
+    are scoped to the taxpayer's SIN.
+    """
+    if idempotency_key:
+        key = scoped_key(request.profile, idempotency_key)
+    else:
+        key = calculation_key(request.tax_year, request.profile, request.slips)
+    job = await submission_queue.find(key)
+    created = False
+    if job is None or job["status"] == "failed":
+        xml_payload = await executor.run(jobs.netfile_xml, request.tax_year, request.profile, request.slips)
+        job, created = await submission_queue.submit(key, xml_payload)
+    return FastJSONResponse(dict(job, status_url=f"/api/submissions/{job['job_id']}"), status_code=202 if created else 200)
+
+@app.get("/api/submissions/stats")
+def submission_stats():
+    return submission_queue.stats()
+
+@app.get("/api/submissions/{job_id}")
+def submission_status(job_id: str):
+    job = submission_queue.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return job
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from engine.dag import TaxCalculationEngine
+
+@pytest.fixture(scope="session")
+def client(tmp_path_factory):
+    # main opens its submission queue database at import; no workers, so
+    # queued submissions stay put for the tests to inspect
+    os.environ.setdefault("TAXSIMPLE_SUBMISSION_DB", str(tmp_path_factory.mktemp("api") / "submissions.db"))
+    os.environ.setdefault("TAXSIMPLE_SUBMISSION_WORKERS", "0")
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def engine():
+    return TaxCalculationEngine()
+
+def employment_return(income, rrsp=5000.0):
+    """
+    A single-T4 return withholding 20% of income, with an RRSP receipt.
+    """
+    if not income:
+        return {}, []
+    return {}, [
+        {"type": "T4", "boxes": {"14": income, "22": income * 0.2}},
+        {"type": "RRSP", "amount": rrsp},
+    ]
@@ -0,0 +1,28 @@
+import random
+
+from benchmarks.generator import generate_returns
+from engine.aggregation import SlipAggregates
+from engine.slips import parse_slips
+
+def test_totals_by_type_and_box():
+    aggregates = SlipAggregates.from_slips([
+        {"type": "T4", "boxes": {"14": 60000, "22": 9000, "10": "ON"}},
+        {"type": "T4", "boxes": {"14": 1000}},
+        {"type": "RRSP", "amount": 5000},
+        {"type": "T2125", "netIncome": -200},
+    ])
+    assert aggregates.box("T4", "14") == 61000.0
+    assert aggregates.box("T4", "10") == 0.0
+    assert aggregates.amount("RRSP") == 5000.0
+    assert aggregates.amount("T2125", "netIncome") == -200.0
+    assert aggregates.box("T5", "24") == 0.0
+
+def test_rebuild_matches_a_fresh_aggregation():
+    rng = random.Random(3)
+    _, slips = generate_returns(1, "heavy", seed=3)[0]
+    slips = parse_slips(slips)
+    aggregates = SlipAggregates.from_slips(slips)
+    for _ in range(20):
+        removed = slips.pop(rng.randrange(len(slips)))
+        aggregates.rebuild({removed.type}, slips)
+        assert aggregates == SlipAggregates.from_slips(slips)
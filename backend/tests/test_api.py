@@ -0,0 +1,21 @@
+import json
+
+GOOD = {"tax_year": 2024, "profile": {}, "slips": [{"type": "T4", "boxes": {"14": 60000, "22": 9000}}]}
+BAD_SLIP = {"tax_year": 2024, "profile": {}, "slips": [{"type": "T4", "boxes": {"14": "abc"}}]}
+
+def test_calculate_stream_reports_bad_lines_and_keeps_going(client):
+    lines = [json.dumps(GOOD), "not json", json.dumps(BAD_SLIP), json.dumps({"tax_year": 2024}), json.dumps(GOOD)]
+    response = client.post(
+        "/api/calculate/stream?compact=true",
+        content="\n".join(lines) + "\n",
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    out = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["line"] for item in out] == [1, 2, 3, 4, 5]
+    assert ["result" in item for item in out] == [True, False, False, False, True]
+    assert out[0]["result"]["federal_tax"] == out[4]["result"]["federal_tax"] == 8380.05 + 4133 * 0.205
+    assert out[1]["error"][0]["type"] == "json_invalid"
+    assert "input" not in out[1]["error"][0]
+    assert out[2]["error"][0]["loc"] == ["slips"]
+    assert {error["loc"][0] for error in out[3]["error"]} == {"profile", "slips"}
@@ -0,0 +1,43 @@
+from benchmarks.generator import SHAPES, generate_returns
+from benchmarks.harness import Benchmark, compare, format_table, load_baseline, run_benchmark, save_baseline
+from engine.slips import parse_slips
+
+RESULT = {"throughput": 1000.0, "p50_ms": 1.0, "p99_ms": 2.0, "peak_kib": 100.0}
+
+def test_generator_is_deterministic_per_seed_and_shape():
+    assert generate_returns(20, "typical", seed=3) == generate_returns(20, "typical", seed=3)
+    assert generate_returns(20, "typical", seed=3) != generate_returns(20, "typical", seed=4)
+    for shape, (low, high) in SHAPES.items():
+        for profile, slips in generate_returns(5, shape):
+            assert low <= len(slips) <= high
+            assert slips[0]["type"] == "T4"
+            parse_slips(slips)
+
+def test_generated_returns_calculate(engine):
+    for profile, slips in generate_returns(10, "typical"):
+        assert engine.calculate(2024, profile, slips)["total_income"] > 0
+
+def test_compare_flags_only_regressions_beyond_the_threshold():
+    baseline = {"case": RESULT, "gone": RESULT}
+    assert compare({"case": dict(RESULT, throughput=850.0, p99_ms=2.3), "new": RESULT}, baseline, 0.2) == []
+    regressions = compare({"case": {"throughput": 700.0, "p50_ms": 1.0, "p99_ms": 2.5, "peak_kib": 300.0}}, baseline, 0.2)
+    assert [line.split(":")[1].split()[0] for line in regressions] == ["throughput", "p99", "peak"]
+    # Peak growth under min_peak_kib is noise
+    assert compare({"case": dict(RESULT, peak_kib=150.0)}, baseline, 0.2) == []
+
+def test_run_benchmark_reports_every_call_and_resets_each_pass():
+    calls, resets = [], []
+    benchmark = Benchmark("noop", calls.append, list(range(10)), units=5, reset=lambda: resets.append(1))
+    result = run_benchmark(benchmark, repeat=2, warmup=3, memory_calls=4)
+    assert result["calls"] == 10
+    assert len(calls) == 3 + 2 * 10 + 4 and len(resets) == 4
+    assert result["throughput"] > 0 and result["p50_ms"] <= result["p99_ms"]
+
+def test_baseline_round_trip_and_table(tmp_path):
+    path = str(tmp_path / "nested" / "baseline.json")
+    save_baseline(path, {"case": RESULT})
+    assert load_baseline(path) == {"case": RESULT}
+    table = format_table({"case": dict(RESULT, throughput=1100.0)}, {"case": RESULT})
+    header, row = table.splitlines()
+    assert header.split() == ["benchmark", "returns/s", "p50", "ms", "p99", "ms", "peak", "KiB", "vs", "base"]
+    assert row.split() == ["case", "1,100", "1.000", "2.000", "100", "+10%"]
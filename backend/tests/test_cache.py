@@ -0,0 +1,50 @@
+import sqlite3
+import time
+
+from engine.aggregation import SlipAggregates
+from engine.cache import CalculationCache, SQLiteCacheBackend, calculation_key
+from engine.dag import TaxCalculationEngine
+
+PROFILE = {"first_name": "Olivia", "sin": "046454286", "province": "ON"}
+SLIPS = [{"type": "T4", "boxes": {"14": 60000, "22": 9000}}, {"type": "RRSP", "amount": 5000}]
+
+def test_key_ignores_dict_order():
+    assert calculation_key(2024, {"a": 1, "b": 2}, SLIPS) == calculation_key(2024, {"b": 2, "a": 1}, SLIPS)
+    assert calculation_key(2024, PROFILE, SLIPS) != calculation_key(2023, PROFILE, SLIPS)
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = CalculationCache(max_entries=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 2
+
+def test_shared_tier_stores_no_inputs_and_restores_the_local_form(tmp_path):
+    path = str(tmp_path / "cache.db")
+    writer = TaxCalculationEngine(cache=CalculationCache(shared_backend=SQLiteCacheBackend(path)))
+    reader_cache = CalculationCache(shared_backend=SQLiteCacheBackend(path))
+    reader = TaxCalculationEngine(cache=reader_cache)
+
+    local = writer.calculate(2024, PROFILE, SLIPS)
+    shared = reader.calculate(2024, PROFILE, SLIPS)
+    assert reader_cache.stats()["shared_hits"] == 1
+
+    stored = sqlite3.connect(path).execute("SELECT value FROM calculation_cache").fetchone()[0]
+    assert PROFILE["sin"] not in stored
+    assert '"slips"' not in stored and '"profile"' not in stored
+
+    assert isinstance(shared["slip_aggregates"], SlipAggregates)
+    assert shared["slip_aggregates"].box("T4", "14") == 60000.0
+    assert list(shared) == list(local)
+    for key in local:
+        if key != "slips":
+            assert shared[key] == local[key], key
+    assert [slip.to_dict() for slip in shared["slips"]] == [slip.to_dict() for slip in local["slips"]]
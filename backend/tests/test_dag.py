@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from benchmarks.generator import generate_returns
+from engine.dag import TaxCalculationNode, topological_order
+from tests.conftest import employment_return
+
+# (year, T4 income, federal tax on income less the $5,000 RRSP deduction),
+# worked by hand from each year's brackets
+GOLDEN = [
+    (2023, 0, 0.0),
+    (2023, 40000, 5250.0),
+    (2023, 60000, 8340.255),
+    (2023, 120000, 21095.82),
+    (2023, 300000, 74155.92),
+    (2024, 0, 0.0),
+    (2024, 40000, 5250.0),
+    (2024, 60000, 8250.0),
+    (2024, 120000, 20682.0),
+    (2024, 300000, 73065.77),
+    (2025, 0, 0.0),
+    (2025, 40000, 5075.0),
+    (2025, 60000, 7975.0),
+    (2025, 120000, 20146.25),
+    (2025, 300000, 72123.23),
+]
+
+def _node(node_id, *dependencies):
+    return TaxCalculationNode(node_id, lambda deps: None, dependencies)
+
+def test_topological_order_respects_dependencies_and_registration_order():
+    nodes = {
+        "c": _node("c", "a", "b"),
+        "a": _node("a", "slips"),
+        "b": _node("b", "a"),
+        "d": _node("d", "profile"),
+    }
+    assert topological_order(nodes) == ["a", "d", "b", "c"]
+
+def test_topological_order_rejects_cycles():
+    nodes = {"a": _node("a", "b"), "b": _node("b", "a"), "c": _node("c")}
+    with pytest.raises(ValueError, match="cycle through: a, b"):
+        topological_order(nodes)
+
+def test_topological_order_rejects_unknown_dependencies():
+    with pytest.raises(ValueError, match="unknown node 'missing'"):
+        topological_order({"a": _node("a", "missing")})
+
+@pytest.mark.parametrize("year, income, federal_tax", GOLDEN)
+def test_calculate_golden_values(engine, year, income, federal_tax):
+    result = engine.calculate(year, *employment_return(income))
+    taxable = max(0.0, income - 5000.0) if income else 0.0
+    assert result["taxable_income"] == pytest.approx(taxable)
+    assert result["federal_tax"] == pytest.approx(federal_tax, abs=1e-6)
+    assert result["refund_or_balance"] == pytest.approx(income * 0.2 - federal_tax, abs=1e-6)
+
+@pytest.mark.parametrize("year", [2023, 2024, 2025])
+def test_calculate_batch_golden_values(engine, year):
+    cases = [case for case in GOLDEN if case[0] == year]
+    results = engine.calculate_batch(year, [employment_return(income) for _, income, _ in cases])
+    for (_, income, federal_tax), result in zip(cases, results):
+        assert result["federal_tax"] == pytest.approx(federal_tax, abs=1e-6)
+
+def test_node_values_serialize_as_floats(engine):
+    # Amounts are always floats in JSON, including for an empty return
+    for result in (engine.calculate(2024, {}, []), engine.calculate_batch(2024, [({}, [])])[0]):
+        for key in ("total_income", "net_income", "taxable_income", "federal_tax", "tax_deducted", "refund_or_balance"):
+            assert isinstance(result[key], float), key
+        assert json.loads(json.dumps(result["federal_tax"])) == 0.0
+        assert json.dumps(result["federal_tax"]) == "0.0"
+
+@pytest.mark.parametrize("year", [2023, 2024, 2025])
+def test_calculate_batch_matches_calculate(engine, year):
+    returns = generate_returns(200, "typical", seed=year)
+    batch = engine.calculate_batch(year, returns)
+    for (profile, slips), result in zip(returns, batch):
+        scalar = engine.calculate(year, profile, slips)
+        assert list(result) == list(scalar)
+        for key in scalar:
+            if key not in ("slips", "slip_aggregates"):
+                assert result[key] == scalar[key], key
+        assert dict(result["slip_aggregates"]) == dict(scalar["slip_aggregates"])
+
+def test_plans_are_compiled_once_per_rate_year(engine):
+    plan = engine.compile(2024)
+    assert engine.compile(2024) is plan
+    # Years outside the rate tables use the closest year's plan
+    assert engine.compile(2030) is engine.compile(2025)
+    assert engine.compile(2019) is engine.compile(2023)
+    assert plan.order == [
+        "slip_aggregates", "total_income", "rrsp_deduction", "tax_deducted",
+        "net_income", "taxable_income", "federal_tax", "refund_or_balance",
+    ]
+
+def test_evaluations_share_no_state(engine):
+    _, slips = employment_return(60000)
+    first = engine.calculate(2024, {}, slips)
+    engine.calculate(2024, {}, [{"type": "T4", "boxes": {"14": 1}}])
+    assert engine.calculate(2024, {}, slips)["federal_tax"] == first["federal_tax"]
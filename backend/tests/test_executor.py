@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+
+from engine.dag import TaxCalculationEngine
+from engine import executor as executor_module
+from engine.executor import EngineExecutor, Overloaded
+import jobs
+
+SLIPS = [{"type": "T4", "boxes": {"14": 60000, "22": 9000}}]
+
+def _wait(services, event):
+    event.wait(5)
+    return "done"
+
+@pytest.fixture
+def isolated(monkeypatch):
+    # Thread mode installs its services module-wide; keep the API's intact
+    monkeypatch.setattr(executor_module, "_services", executor_module._services)
+    monkeypatch.setattr(executor_module, "_profiler", executor_module._profiler)
+
+def test_sheds_beyond_max_inflight_and_waits_when_asked(isolated):
+    executor = EngineExecutor({}, workers=1, max_inflight=1, retry_after=3)
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(executor.run(_wait, release))
+        await asyncio.sleep(0.05)
+        with pytest.raises(Overloaded) as shed:
+            await executor.run(_wait, release)
+        assert shed.value.retry_after == 3
+        waiting = asyncio.ensure_future(executor.run(_wait, release, shed=False))
+        await asyncio.sleep(0.05)
+        assert executor.stats()["inflight"] == 1
+        release.set()
+        return await first, await waiting
+
+    try:
+        assert asyncio.run(run()) == ("done", "done")
+        assert executor.stats()["shed"] == 1 and executor.stats()["inflight"] == 0
+    finally:
+        executor.shutdown()
+
+def test_process_mode_runs_jobs_on_worker_copies_of_the_services():
+    engine = TaxCalculationEngine()
+    executor = EngineExecutor({"engine": engine}, mode="process", workers=1)
+
+    async def run():
+        await executor.start()
+        return await executor.run(jobs.calculate, 2024, {}, SLIPS, True)
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        executor.shutdown()
+    assert result == jobs.calculate({"engine": engine}, 2024, {}, SLIPS, True)
+    assert "slips" not in result
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        EngineExecutor({}, mode="fiber")
+
+def test_api_answers_shed_requests_with_429(client, monkeypatch):
+    import main
+
+    async def full(*args, **kwargs):
+        raise Overloaded(7)
+
+    monkeypatch.setattr(main.executor, "run", full)
+    response = client.post("/api/calculate", json={"tax_year": 2024, "profile": {}, "slips": SLIPS})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+import random
+
+import pytest
+
+from benchmarks.generator import generate_returns
+from engine.household import household_tax, optimize_household
+from engine.optimizer import OptimizationEngine
+from engine.rates import RATE_TABLES
+
+RULES = RATE_TABLES.for_year(2024)
+
+def _spouse(rng):
+    income = rng.choice([0.0, 15000.0, 48000.0, 90000.0, 180000.0, 300000.0]) + rng.uniform(0, 5000)
+    return SimpleNamespace(
+        net_income=income, taxable_income=income, age=rng.choice([40, 66, 72]),
+        pension_income=rng.choice([0.0, 12000.0, 40000.0]),
+        total_medical_expenses=rng.choice([0.0, 800.0, 6000.0]),
+        charitable_donations=rng.choice([0.0, 150.0, 2500.0]),
+    )
+
+def _brute_force(primary, spouse):
+    pensions = [f / 100 * p for f in range(51) for p in (primary.pension_income * (primary.age >= 65),
+                                                             -spouse.pension_income * (spouse.age >= 65))]
+    return min(
+        float(household_tax(RULES, primary, spouse, shift, medical, donation / 10))
+        for shift in pensions for medical in (0.0, 1.0) for donation in range(11)
+    )
+
+@pytest.mark.parametrize("seed", range(40))
+def test_grid_optimum_matches_brute_force_and_parts_add_up(seed):
+    rng = random.Random(seed)
+    primary, spouse = _spouse(rng), _spouse(rng)
+    plan = optimize_household(RULES, primary, spouse, split_pension=True)
+
+    assert plan["optimized_tax"] == pytest.approx(_brute_force(primary, spouse), abs=0.01)
+    assert plan["optimized_tax"] <= plan["baseline_tax"]
+    assert plan["pension_savings"] + plan["medical_savings"] + plan["donation_savings"] == pytest.approx(plan["savings"])
+
+def test_pension_is_not_split_by_default():
+    rng = random.Random(1)
+    primary, spouse = _spouse(rng), _spouse(rng)
+    primary.age, primary.pension_income, primary.taxable_income = 70, 60000.0, 120000.0
+    primary.net_income = primary.taxable_income
+    assert optimize_household(RULES, primary, spouse, split_pension=True)["pension_shift"] > 0
+    plan = optimize_household(RULES, primary, spouse)
+    assert plan["pension_shift"] == 0.0 and plan["pension_savings"] == 0.0
+
+def test_household_analysis_reconciles(engine):
+    optimizer = OptimizationEngine()
+    returns = generate_returns(60, "typical", seed=18)
+    for (p1, s1), (p2, s2) in zip(returns[::2], returns[1::2]):
+        r1, r2 = engine.calculate(2024, p1, s1), engine.calculate(2024, p2, s2)
+        analysis = optimizer.run_analyzers(r1, 2024, p1, s1, (r2, p2, s2))
+        plan = analysis["household"]
+        assert plan["medical_savings"] + plan["donation_savings"] + plan["pension_savings"] == pytest.approx(plan["savings"])
+        types = {item["type"] for item in analysis["opportunities"]}
+        assert "PENSION_SPLITTING" not in types
+
+def test_no_household_analysis_without_a_spouse_return(engine):
+    optimizer = OptimizationEngine()
+    profile = {"marital_status": "Married", "age": 70}
+    slips = [{"type": "T4", "boxes": {"14": 90000}}, {"type": "T4A", "boxes": {"16": 30000}},
+             {"type": "Medical", "amount": 5000}, {"type": "T5", "boxes": {"24": 20000}}]
+    tax_return = optimizer.build_tax_return(engine.calculate(2024, profile, slips), 2024, profile, slips)
+    assert not tax_return.has_spouse and tax_return.household is None
+
+    analysis = optimizer.run_analyzers(engine.calculate(2024, profile, slips), 2024, profile, slips)
+    assert analysis["household"] is None
+    assert {item["type"] for item in analysis["opportunities"]}.isdisjoint(
+        {"SPOUSAL_ATTRIBUTION", "MEDICAL_EXPENSES", "PENSION_SPLITTING", "DONATION_POOLING"}
+    )
+
+@pytest.mark.parametrize("age", ["70", "senior", None, True])
+def test_free_form_ages_do_not_fail_the_household_search(client, age):
+    me = {"profile": {"age": age}, "slips": [{"type": "T4", "boxes": {"14": 90000}}, {"type": "T4A", "boxes": {"16": 30000}}]}
+    spouse = {"profile": {"age": 68}, "slips": [{"type": "T4", "boxes": {"14": 20000}}, {"type": "Medical", "amount": 4000}]}
+    response = client.post("/api/optimize", json=dict(me, tax_year=2024, spouse=spouse))
+    assert response.status_code == 200
+    assert response.json()["household"]["savings"] >= 0
+
+def test_failed_household_search_is_partial(engine, monkeypatch):
+    optimizer = OptimizationEngine()
+    monkeypatch.setattr(optimizer, "optimize_household", lambda tax_return: 1 / 0)
+    profile = {"age": 40}
+    slips = [{"type": "T4", "boxes": {"14": 90000}}, {"type": "Medical", "amount": 4000}]
+    result = engine.calculate(2024, profile, slips)
+    analysis = optimizer.run_analyzers(result, 2024, profile, slips, (result, profile, slips))
+    assert analysis["household"] is None
+    assert {"analyzer": "household", "reason": "error", "error": "division by zero"} in analysis["partial"]
+    assert analysis["opportunities"]
+
+def test_optimize_endpoint_household_mode(client):
+    me = {"profile": {"age": 40}, "slips": [{"type": "T4", "boxes": {"14": 150000}}, {"type": "T5", "boxes": {"24": 20000}},
+                                            {"type": "Medical", "amount": 3000}]}
+    spouse = {"profile": {"age": 38}, "slips": [{"type": "T4", "boxes": {"14": 30000}}, {"type": "Donation", "amount": 1000}]}
+    body = dict(me, tax_year=2024, spouse=spouse)
+    response = client.post("/api/optimize", json=body)
+    assert response.status_code == 200
+    data = response.json()
+    plan = data["household"]
+    assert plan["savings"] > 0
+    assert plan["medical_share"] == 0.0
+    types = {item["type"] for item in data["opportunities"]}
+    assert {"MEDICAL_EXPENSES", "SPOUSAL_ATTRIBUTION"} <= types
+    assert "household" not in client.post("/api/optimize", json=dict(me, tax_year=2024)).json()
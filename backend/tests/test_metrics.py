@@ -0,0 +1,68 @@
+from engine.metrics import MetricsRegistry
+
+def test_counter_renders_labelled_series_sorted_and_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Jobs run", ("kind",))
+    counter.inc(labels=("b",))
+    counter.inc(2, labels=('a"\n',))
+    assert registry.render() == (
+        "# HELP jobs_total Jobs run\n"
+        "# TYPE jobs_total counter\n"
+        'jobs_total{kind="a\\"\\n"} 2\n'
+        'jobs_total{kind="b"} 1\n'
+    )
+
+def test_histogram_buckets_are_cumulative_with_inf():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.samples() == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+def test_worker_deltas_drain_and_merge_into_the_api_registry():
+    api, worker = MetricsRegistry(), MetricsRegistry()
+    for registry in (api, worker):
+        registry.counter("jobs_total", "Jobs run")
+        registry.histogram("latency_seconds", "Latency", buckets=(1.0,))
+    api.metrics["jobs_total"].inc()
+    api.metrics["latency_seconds"].observe(0.5)
+    worker.metrics["jobs_total"].inc(3)
+    worker.metrics["latency_seconds"].observe(2.0)
+
+    api.merge(worker.drain())
+    assert worker.drain() == {} and worker.render() == "\n"
+    assert "jobs_total 4" in api.render()
+    assert api.metrics["latency_seconds"].samples()[-3:] == [
+        'latency_seconds_bucket{le="+Inf"} 2', "latency_seconds_sum 2.5", "latency_seconds_count 2",
+    ]
+
+def test_registry_reuses_metrics_by_name_and_describes_collectors_once():
+    registry = MetricsRegistry()
+    assert registry.counter("jobs_total", "Jobs run") is registry.counter("jobs_total", "Jobs run")
+    registry.register_collector(lambda: [
+        ("queue_jobs", "gauge", "Jobs by status", {"status": "failed"}, 1),
+        ("queue_jobs", "gauge", "Jobs by status", {"status": "sent"}, 2.5),
+    ])
+    assert registry.render() == (
+        "# HELP queue_jobs Jobs by status\n"
+        "# TYPE queue_jobs gauge\n"
+        'queue_jobs{status="failed"} 1\n'
+        'queue_jobs{status="sent"} 2.5\n'
+    )
+
+def test_metrics_endpoint_exposes_engine_and_service_metrics(client):
+    client.post("/api/calculate", json={"tax_year": 2024, "profile": {}, "slips": []})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert "# TYPE taxsimple_http_requests_total counter" in text
+    assert "# TYPE taxsimple_serialization_seconds histogram" in text
+    assert "taxsimple_executor_shed_total " in text
+    assert "taxsimple_cache_misses_total " in text
@@ -0,0 +1,52 @@
+import io
+import json
+import xml.etree.ElementTree as ET
+
+from api.netfile import NetfileService, T1XmlWriter, iter_batch_xml, xml_text
+
+RESULT = {"total_income": 60000, "net_income": 55000, "taxable_income": 55000, "refund_or_balance": -12.5}
+PROFILE = {"sin": "046454286", "first_name": "Ann & <Bo>", "last_name": "O\x00'Neil\x0b"}
+
+def test_xml_text_escapes_markup_and_strips_invalid_characters():
+    assert xml_text("plain") == "plain"
+    assert xml_text(42) == "42"
+    assert xml_text("a & <b>") == "a &amp; &lt;b&gt;"
+    assert xml_text("O\x00'Neil\x0b￾") == "O'Neil"
+
+def test_single_return_parses_and_keeps_names_verbatim():
+    root = ET.fromstring(NetfileService().generate_xml(RESULT, PROFILE).encode())
+    assert root.tag == "T1Return"
+    assert root.findtext("Taxpayer/FirstName") == "Ann & <Bo>"
+    assert root.findtext("Taxpayer/LastName") == "O'Neil"
+    assert root.findtext("Summary/RefundOrBalance") == "-12.50"
+
+def test_batch_writers_agree_and_record_rejected_lines():
+    returns = [(RESULT, PROFILE), ({}, {})]
+    out = io.StringIO()
+    assert NetfileService().write_batch_xml(iter(returns), out) == 2
+    chunks = list(iter_batch_xml(iter(returns)))
+    assert len(chunks) == 3 and "".join(chunks) == out.getvalue()
+
+    parts = []
+    writer = T1XmlWriter(parts.append, batch=True)
+    writer.start()
+    writer.write_return(RESULT, PROFILE)
+    writer.write_rejected(2, "slips: <bad>")
+    writer.close()
+    root = ET.fromstring("".join(parts).encode())
+    assert [child.tag for child in root] == ["T1Return", "RejectedReturn"]
+    assert root[1].get("line") == "2" and root[1].text == "slips: <bad>"
+    assert writer.count == 1
+
+def test_batch_endpoint_streams_one_element_per_line(client):
+    good = {"tax_year": 2024, "profile": PROFILE, "slips": [{"type": "T4", "boxes": {"14": 60000, "22": 9000}}]}
+    body = "\n".join([json.dumps(good), "not json", json.dumps({"tax_year": 2024}), json.dumps(good)]) + "\n"
+    response = client.post("/api/netfile/batch", content=body)
+    assert response.status_code == 200
+    root = ET.fromstring(response.content)
+    assert root.tag == "T1ReturnBatch"
+    assert [child.tag for child in root] == ["T1Return", "RejectedReturn", "RejectedReturn", "T1Return"]
+    assert [child.get("line") for child in root[1:3]] == ["2", "3"]
+    single = client.post("/api/calculate", json=good).json()
+    assert root[0].findtext("Summary/TotalIncome") == f"{single['total_income']:.2f}"
+    assert root[0].findtext("Taxpayer/FirstName") == "Ann & <Bo>"
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+from engine.optimizer import OptimizationEngine
+
+PROFILE = {"marital_status": "Single", "rrsp_limit": 20000, "available_cash": 20000}
+SLIPS = [{"type": "T4", "boxes": {"14": 90000, "22": 18000}}]
+
+def _sleeper(seconds, savings):
+    def analyzer(tax_return):
+        time.sleep(seconds)
+        return [{"type": "TEST", "savings": savings, "message": ""}]
+    return analyzer
+
+def _optimizer(**kwargs):
+    optimizer = OptimizationEngine(**kwargs)
+    optimizer.analyzers.clear()
+    return optimizer
+
+def test_budget_excludes_time_queued_behind_other_analyzers(engine):
+    # One worker: the second analyzer waits 0.3 s for the first to finish
+    optimizer = _optimizer(default_time_budget=0.5, executor=ThreadPoolExecutor(max_workers=1))
+    optimizer.register_analyzer("first", _sleeper(0.3, 1))
+    optimizer.register_analyzer("second", _sleeper(0.3, 2))
+
+    analysis = optimizer.run_analyzers(engine.calculate(2024, PROFILE, SLIPS), 2024, PROFILE, SLIPS)
+    assert analysis["partial"] == []
+    assert [item["savings"] for item in analysis["opportunities"]] == [2, 1]
+
+def test_slow_and_failing_analyzers_are_reported_as_partial(engine):
+    optimizer = _optimizer(default_time_budget=0.5)
+    optimizer.register_analyzer("slow", _sleeper(0.3, 1), time_budget=0.05)
+    optimizer.register_analyzer("fast", _sleeper(0, 2))
+    optimizer.register_analyzer("broken", lambda tax_return: 1 / 0)
+
+    analysis = optimizer.run_analyzers(engine.calculate(2024, PROFILE, SLIPS), 2024, PROFILE, SLIPS)
+    assert [item["savings"] for item in analysis["opportunities"]] == [2]
+    assert analysis["partial"] == [
+        {"analyzer": "slow", "reason": "timeout", "time_budget": 0.05},
+        {"analyzer": "broken", "reason": "error", "error": "division by zero"},
+    ]
+
+def test_analyzers_that_never_get_a_thread_are_reported_not_started(engine):
+    # Two hung analyzers from earlier requests hold both pool threads
+    release = threading.Event()
+    optimizer = _optimizer(default_time_budget=0.2, executor=ThreadPoolExecutor(max_workers=2))
+    optimizer.register_analyzer("hangs", lambda tax_return: release.wait(10) and [])
+    result = engine.calculate(2024, PROFILE, SLIPS)
+    try:
+        for _ in range(2):
+            assert optimizer.run_analyzers(result, 2024, PROFILE, SLIPS)["partial"][0]["reason"] == "timeout"
+        start = time.monotonic()
+        analysis = optimizer.run_analyzers(result, 2024, PROFILE, SLIPS)
+        assert time.monotonic() - start < 1.0
+        assert analysis["partial"] == [{"analyzer": "hangs", "reason": "not_started", "time_budget": 0.2}]
+    finally:
+        release.set()
+
+def test_start_budget_bounds_the_wait_for_a_thread(engine):
+    optimizer = _optimizer(default_time_budget=0.5, start_budget=0.1, executor=ThreadPoolExecutor(max_workers=1))
+    optimizer.register_analyzer("first", _sleeper(0.3, 1))
+    optimizer.register_analyzer("second", _sleeper(0, 2))
+
+    analysis = optimizer.run_analyzers(engine.calculate(2024, PROFILE, SLIPS), 2024, PROFILE, SLIPS)
+    assert [item["savings"] for item in analysis["opportunities"]] == [1]
+    assert analysis["partial"] == [{"analyzer": "second", "reason": "not_started", "time_budget": 0.5}]
+
+def _rrsp_return(engine, income, limit, cash):
+    optimizer = OptimizationEngine()
+    profile = {"rrsp_limit": limit, "available_cash": cash}
+    slips = [{"type": "T4", "boxes": {"14": income}}]
+    return optimizer, optimizer.build_tax_return(engine.calculate(2024, profile, slips), 2024, profile, slips)
+
+def test_rrsp_curve_is_exact_at_every_contribution(engine):
+    optimizer, tax_return = _rrsp_return(engine, 130000, 30000, 30000)
+    brackets = optimizer.rates.for_year(2024).federal
+    curve = optimizer.rrsp_savings_curve(tax_return)
+    contributions = [point["contribution"] for point in curve]
+    # Both thresholds crossed on the way down from $130,000 are breakpoints
+    assert contributions == [0.0, 130000 - 111733, 30000.0]
+    for point in curve:
+        assert point["tax_savings"] == pytest.approx(brackets.tax(130000) - brackets.tax(130000 - point["contribution"]))
+
+@pytest.mark.parametrize("income, limit, cash", [(130000, 30000, 30000), (60000, 20000, 2500), (250000, 31560, 50000), (52000, 5000, 5000)])
+def test_optimal_rrsp_contribution_matches_a_dense_search(engine, income, limit, cash):
+    optimizer, tax_return = _rrsp_return(engine, income, limit, cash)
+    brackets = optimizer.rates.for_year(2024).federal
+    future_rate = brackets.marginal_rate(optimizer.project_future_income(tax_return))
+
+    def net_benefit(amount):
+        savings = brackets.tax(income) - brackets.tax(max(0.0, income - amount))
+        return savings - optimizer.calculate_ccb_impact(tax_return, amount) - amount * future_rate * 0.7
+
+    cap = min(limit, cash)
+    step = cap / 2000
+    dense = max(0.0, max(net_benefit(step * i) for i in range(2001)))
+    best = optimizer.calculate_optimal_rrsp_contribution(tax_return).get("net_lifetime_benefit", 0.0)
+    # At least as good as any grid point, and the grid gets within one step
+    # (the benefit changes by less than $1 per dollar contributed)
+    assert dense - 1e-6 <= best <= dense + step
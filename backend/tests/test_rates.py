@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from engine.rates import RATE_TABLES, TAX_YEAR_CONFIG, TaxBrackets
+
+def _reference_tax(brackets, income):
+    # Bracket by bracket, as the tables are published
+    tax = 0.0
+    bounds = [threshold for threshold, _ in brackets[1:]] + [float("inf")]
+    for (lower, rate), upper in zip(brackets, bounds):
+        if income > lower:
+            tax += (min(income, upper) - lower) * rate
+    return tax
+
+@pytest.mark.parametrize("year", sorted(TAX_YEAR_CONFIG))
+def test_tax_matches_the_published_schedule(year):
+    config = TAX_YEAR_CONFIG[year]["federal_brackets"]
+    brackets = RATE_TABLES.for_year(year).federal
+    incomes = [0.0, 1.0, 25000.0, 299999.99, 1e6] + [
+        threshold + delta for threshold, _ in config[1:] for delta in (-0.01, 0, 0.01)
+    ]
+    for income in incomes:
+        assert brackets.tax(income) == pytest.approx(_reference_tax(config, income), abs=1e-6), income
+    column = brackets.tax_array(np.array(incomes))
+    assert column.tolist() == [brackets.tax(income) for income in incomes]
+    assert brackets.marginal_rate_array(np.array(incomes)).tolist() == [brackets.marginal_rate(income) for income in incomes]
+
+def test_income_on_a_threshold_is_in_the_lower_bracket():
+    brackets = TaxBrackets([(0, 0.1), (100, 0.2)])
+    assert brackets.marginal_rate(100) == 0.1
+    assert brackets.marginal_rate(100.01) == 0.2
+    assert brackets.tax(150) == pytest.approx(20.0)
+
+def test_years_outside_the_tables_use_the_closest_year():
+    assert RATE_TABLES.for_year(2019).year == 2023
+    assert RATE_TABLES.for_year(2031).year == 2025
+    assert RATE_TABLES.for_year(2024).cpp_max_employee == 3867.50
@@ -0,0 +1,64 @@
+import pytest
+
+from benchmarks.generator import generate_returns
+from engine.dag import TaxCalculationEngine, profile_age
+from engine.recovery import SanityRule, TaxCalculationRecoveryService
+
+AGES = [70, "67", "senior", None, True, 64.5, [65], "nan"]
+
+@pytest.fixture
+def senior_engine():
+    engine = TaxCalculationEngine()
+    engine.recovery_service.register_rule(SanityRule(
+        "senior", "INFO", ("age",),
+        lambda limits, v: v["age"] >= 65,
+        lambda limits, v: {"message": "Senior", "age": v["age"]},
+    ))
+    return engine
+
+def _mixed_returns():
+    returns = []
+    for i, (profile, slips) in enumerate(generate_returns(80, "typical", seed=13)):
+        profile = dict(profile)
+        age = AGES[i % len(AGES)]
+        if age is None:
+            del profile["age"]
+        else:
+            profile["age"] = age
+        returns.append((profile, slips))
+    return returns
+
+def test_batch_checks_match_scalar_checks_for_mixed_returns(senior_engine):
+    returns = _mixed_returns()
+    batch = senior_engine.calculate_batch(2024, returns)
+    for (profile, slips), result in zip(returns, batch):
+        assert result["sanity_checks"] == senior_engine.calculate(2024, profile, slips)["sanity_checks"]
+    fired = sum(check["message"] == "Senior" for result in batch for check in result["sanity_checks"])
+    # 70 and "67" count as ages; the others are skipped
+    assert fired == 20
+
+@pytest.mark.parametrize("value, age", [(70, 70.0), ("67", 67.0), ("senior", None), (True, None), ([65], None), ("inf", None)])
+def test_profile_age(value, age):
+    assert profile_age(value) == age
+
+def test_batch_endpoint_accepts_a_non_numeric_age(client):
+    body = {"tax_year": 2024, "returns": [{"profile": {"age": "senior"}, "slips": [{"type": "T4", "boxes": {"14": 50000}}]}]}
+    response = client.post("/api/calculate/batch", json=body)
+    assert response.status_code == 200
+
+def test_builtin_rules():
+    service = TaxCalculationRecoveryService()
+    inputs = {
+        "total_income": 100.0, "net_income": 100000.0,
+        "employment_income": 50.0, "self_employment_income": 0.0, "investment_income": 0.0, "other_income": 0.0,
+        "cpp_contributions": 5000.0, "ei_contributions": 100.0, "medical_expenses": 500.0,
+    }
+    checks = service.run_checks(2024, inputs)
+    assert [check["severity"] for check in checks] == ["ERROR", "ERROR", "INFO"]
+    assert checks[0]["difference"] == -50.0
+    assert checks[1]["excess"] == pytest.approx(5000.0 - 3867.50)
+    assert service.run_checks_batch(2024, [inputs, {}]) == [checks, []]
+
+    stats = service.rule_stats()
+    assert stats["cpp_maximum"]["returns_checked"] == 2
+    assert stats["age_amount"]["returns_skipped"] == 3
@@ -0,0 +1,34 @@
+import numpy as np
+import orjson
+
+from api.responses import FastJSONResponse, dumps_line
+from engine.slips import parse_slip
+
+PROFILE = {"sin": "046454286", "age": 40}
+SLIPS = [{"type": "T4", "boxes": {"14": 60000, "22": 9000}}]
+REQUEST = {"tax_year": 2024, "profile": PROFILE, "slips": SLIPS}
+
+def test_compact_drops_echoed_inputs_and_keeps_values(client):
+    full = client.post("/api/calculate", json=REQUEST).json()
+    compact = client.post("/api/calculate?compact=true", json=REQUEST).json()
+    assert full["profile"] == PROFILE and full["slips"] == SLIPS
+    assert "profile" not in compact and "slips" not in compact
+    assert compact == {key: value for key, value in full.items() if key not in ("profile", "slips")}
+
+def test_fields_pick_result_keys_and_never_echo_inputs(client):
+    result = client.post("/api/calculate?fields=federal_tax,net_income,profile,unknown", json=REQUEST).json()
+    full = client.post("/api/calculate", json=REQUEST).json()
+    assert result == {"federal_tax": full["federal_tax"], "net_income": full["net_income"]}
+
+def test_batch_applies_compact_to_every_result(client):
+    body = {"tax_year": 2024, "returns": [{"profile": PROFILE, "slips": SLIPS}] * 2}
+    results = client.post("/api/calculate/batch?fields=federal_tax", json=body).json()["results"]
+    single = client.post("/api/calculate?fields=federal_tax", json=REQUEST).json()
+    assert results == [single, single]
+
+def test_fast_json_encodes_slips_and_numpy_values():
+    content = {"slip": parse_slip(SLIPS[0]), "total": np.float64(1.5), "years": {2024: np.arange(2)}}
+    expected = {"slip": SLIPS[0], "total": 1.5, "years": {"2024": [0, 1]}}
+    assert orjson.loads(FastJSONResponse(content).body) == expected
+    line = dumps_line(content)
+    assert line.endswith(b"\n") and orjson.loads(line) == expected
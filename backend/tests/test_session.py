@@ -0,0 +1,94 @@
+import threading
+import time
+
+from engine.session import SessionStore
+
+SLIPS = [
+    {"id": "t4", "type": "T4", "boxes": {"14": 60000, "16": 3000, "22": 9000}},
+    {"id": "rrsp", "type": "RRSP", "amount": 5000},
+]
+
+def _comparable(values):
+    return {key: value for key, value in values.items() if key != "slips"}
+
+def test_edits_match_a_fresh_calculation(engine):
+    store = SessionStore(engine)
+    session = store.create(2024, {}, SLIPS)
+    store.update(session.session_id, [{"id": "med", "type": "Medical", "amount": 100}], [])
+    store.update(session.session_id, [{"id": "t4", "type": "T4", "boxes": {"14": 90000, "16": 5000}}], ["rrsp"])
+
+    fresh = engine.calculate(2024, {}, [
+        {"id": "t4", "type": "T4", "boxes": {"14": 90000, "16": 5000}},
+        {"id": "med", "type": "Medical", "amount": 100},
+    ])
+    assert _comparable(session.values) == _comparable(fresh)
+    assert [check["message"] for check in session.values["sanity_checks"]] == [
+        "CPP contributions exceed maximum of $3,867.50",
+        "Medical expenses below $2,700.00 threshold - no benefit",
+    ]
+
+def test_only_rules_with_changed_inputs_rerun(engine, monkeypatch):
+    store = SessionStore(engine)
+    session = store.create(2024, {}, SLIPS)
+    runs = []
+    run_rules = engine.recovery_service.run_rules
+    monkeypatch.setattr(engine.recovery_service, "run_rules",
+                        lambda year, inputs, rule_ids=None: runs.append(rule_ids) or run_rules(year, inputs, rule_ids))
+
+    delta = store.update(session.session_id, [{"type": "Medical", "amount": 100}], [])
+    assert runs == [{"medical_threshold"}]
+    assert delta["sanity_checks"] == [{"severity": "INFO", "message": "Medical expenses below $1,650.00 threshold - no benefit"}]
+
+    runs.clear()
+    store.update(session.session_id, [{"type": "Donation", "amount": 50}], [])
+    # Donations feed no rule
+    assert runs == []
+
+def test_slip_count_stays_exact_under_concurrent_edits_and_eviction(engine):
+    store = SessionStore(engine, max_sessions=8, max_slips=40)
+    sessions = [store.create(2024, {}, SLIPS) for _ in range(8)]
+
+    def edit(worker):
+        for i in range(50):
+            session = sessions[(worker + i) % len(sessions)]
+            store.update(session.session_id, [{"id": f"s{worker}-{i}", "type": "T5", "boxes": {"24": 10}}], [])
+            if i % 7 == 0:
+                sessions.append(store.create(2024, {}, SLIPS))
+
+    threads = [threading.Thread(target=edit, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = store.stats()
+    assert stats["slips"] == sum(session.slip_count for session in store._sessions.values())
+    assert stats["slips"] <= 40 and stats["sessions"] <= 8
+
+def test_an_edit_in_progress_does_not_block_the_store(engine, monkeypatch):
+    store = SessionStore(engine)
+    busy, other = store.create(2024, {}, SLIPS), store.create(2024, {}, SLIPS)
+    applying, release = threading.Event(), threading.Event()
+    apply = busy.apply
+
+    def slow_apply(upsert, remove):
+        applying.set()
+        release.wait(5)
+        return apply(upsert, remove)
+
+    monkeypatch.setattr(busy, "apply", slow_apply)
+    editor = threading.Thread(target=store.update, args=(busy.session_id, [{"id": "new", "type": "T5", "boxes": {"24": 10}}], []))
+    editor.start()
+    try:
+        assert applying.wait(5)
+        start = time.monotonic()
+        assert store.get(other.session_id) is other
+        assert store.update(other.session_id, [{"id": "x", "type": "T5", "boxes": {"24": 5}}], [])["slip_ids"] == ["x"]
+        assert store.stats() == {"sessions": 2, "slips": 2 * len(SLIPS) + 1}
+        # Dropped while the edit runs: the edit doesn't count its slips back in
+        assert store.delete(busy.session_id)
+        assert time.monotonic() - start < 1.0
+    finally:
+        release.set()
+        editor.join()
+    assert store.stats() == {"sessions": 1, "slips": other.slip_count}
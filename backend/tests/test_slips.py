@@ -0,0 +1,69 @@
+import msgpack
+import pytest
+
+from engine.slips import GenericSlip, T4Slip, parse_slip
+
+@pytest.mark.parametrize("data", [
+    {"type": "T4", "boxes": {"14": 60000.0}},
+    {"id": "a", "type": "T4", "boxes": {"14": 60000.0, "22": 9000.0, "10": "ON"}, "employer": "Acme"},
+    {"type": "RRSP"},
+    {"type": "RRSP", "amount": 5000.0},
+    {"type": "T2125", "netIncome": -1200.0, "businessName": "Roy Consulting"},
+    {"type": "RC62", "boxes": {"10": 120.0}, "amount": 5.0},
+])
+def test_to_dict_round_trips(data):
+    assert parse_slip(data).to_dict() == data
+
+def test_absent_boxes_read_as_zero():
+    slip = parse_slip({"type": "T4", "boxes": {"14": 60000}})
+    assert isinstance(slip, T4Slip)
+    assert slip.cpp_contributions == 0.0
+    assert dict(slip.amounts())["14"] == 60000.0
+    assert isinstance(parse_slip({"type": "RC62"}), GenericSlip)
+
+@pytest.mark.parametrize("value", [[1], {"a": 1}, True, "abc", "nan", "inf", "-inf", "1e400", float("nan"), float("inf")])
+def test_bad_amounts_raise_value_error(value):
+    with pytest.raises(ValueError):
+        parse_slip({"type": "T4", "boxes": {"14": value}})
+    with pytest.raises(ValueError):
+        parse_slip({"type": "RRSP", "amount": value})
+
+def test_unmodelled_non_finite_values_raise_value_error():
+    with pytest.raises(ValueError):
+        parse_slip({"type": "T4", "boxes": {"14": 5, "99": float("nan")}})
+    with pytest.raises(ValueError):
+        parse_slip({"type": "RC62", "amount": float("inf")})
+
+def test_bad_slips_are_422_not_500(client):
+    for slips in ([{"type": "T4", "boxes": {"14": [1]}}], [{"type": "RRSP", "amount": {}}], [{"type": "T4", "boxes": [1]}], {},
+                  [{"type": "T4", "boxes": {"14": "inf"}}], [{"type": "T4", "boxes": {"14": "nan"}}],
+                  [{"type": "T4", "boxes": {"14": "1e400"}}]):
+        response = client.post("/api/calculate", json={"tax_year": 2024, "profile": {}, "slips": slips})
+        assert response.status_code == 422, slips
+
+@pytest.mark.parametrize("boxes", ['{"14": Infinity}', '{"14": 1e400}', '{"14": 5, "99": NaN}'])
+def test_non_finite_json_literals_are_422(client, boxes):
+    body = '{"tax_year": 2024, "profile": {}, "slips": [{"type": "T4", "boxes": %s}]}' % boxes
+    response = client.post("/api/calculate", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+    assert "finite" in response.json()["detail"][0]["msg"]
+
+def test_calculate_echoes_slips_as_sent(client):
+    slips = [{"type": "T4", "boxes": {"14": 60000.0}}, {"type": "RRSP", "amount": 5000.0}]
+    response = client.post("/api/calculate", json={"tax_year": 2024, "profile": {}, "slips": slips})
+    assert response.json()["slips"] == slips
+
+def test_msgpack_bodies(client):
+    body = {"tax_year": 2024, "profile": {}, "slips": [{"type": "T4", "boxes": {"14": 60000}}]}
+    response = client.post("/api/calculate?compact=true", content=msgpack.packb(body),
+                           headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.json()["total_income"] == 60000.0
+
+    response = client.post("/api/calculate", content=b"\xc1", headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 422
+
+    # Integer box numbers would miss the modelled boxes; they are rejected
+    body["slips"][0]["boxes"] = {14: 60000}
+    response = client.post("/api/calculate", content=msgpack.packb(body), headers={"Content-Type": "application/msgpack"})
+    assert response.status_code == 422
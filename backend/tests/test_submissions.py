@@ -0,0 +1,183 @@
+import asyncio
+import sqlite3
+import time
+
+import httpx
+import pytest
+
+from api.submissions import SubmissionQueue, SubmissionStore, scoped_key
+
+@pytest.fixture
+def store(tmp_path):
+    return SubmissionStore(str(tmp_path / "submissions.db"))
+
+def _advance(monkeypatch, seconds):
+    now = time.time() + seconds
+    monkeypatch.setattr(time, "time", lambda: now)
+
+def test_enqueue_deduplicates_by_key(store):
+    job, created = store.enqueue("key", "<xml/>")
+    again, created_again = store.enqueue("key", "<xml/>")
+    assert created and not created_again
+    assert again["job_id"] == job["job_id"]
+    assert store.find("key")["job_id"] == job["job_id"]
+
+def test_failed_job_releases_its_key(store):
+    job, _ = store.enqueue("key", "<xml/>")
+    store.fail(job["job_id"], "HTTP 400")
+    assert store.find("key")["status"] == "failed"
+
+    retried, created = store.enqueue("key", "<xml/>")
+    assert created and retried["job_id"] != job["job_id"]
+    assert store.find("key")["job_id"] == retried["job_id"]
+    assert store.get(job["job_id"])["status"] == "failed"
+
+def test_expired_lease_lets_another_worker_claim(store, monkeypatch):
+    job, _ = store.enqueue("key", "<xml/>")
+    claimed = store.claim(lease=60)
+    assert claimed["job_id"] == job["job_id"] and claimed["attempts"] == 1
+    assert store.claim(lease=60) is None
+
+    _advance(monkeypatch, 61)
+    reclaimed = store.claim(lease=60)
+    assert reclaimed["job_id"] == job["job_id"] and reclaimed["attempts"] == 2
+
+def test_backoff_doubles_and_honours_retry_after(store, monkeypatch):
+    queue = SubmissionQueue(store, "http://netfile.test/submit", backoff_base=1.0, backoff_max=10.0, max_attempts=6)
+    job, _ = store.enqueue("key", "<xml/>")
+    delays = []
+    for attempt in range(1, 6):
+        claimed = dict(store.claim(lease=0), attempts=attempt)
+        asyncio.run(queue._retry(claimed, "HTTP 503"))
+        row = store._connection().execute("SELECT next_attempt_at, updated_at FROM submissions").fetchone()
+        delays.append(row[0] - row[1])
+        monkeypatch.setattr(time, "time", lambda: row[0])
+    # Jittered down to half of min(10, 2 ** (attempt - 1))
+    for attempt, delay in enumerate(delays, 1):
+        cap = min(10.0, 2.0 ** (attempt - 1))
+        assert cap / 2 <= delay <= cap
+
+    claimed = dict(store.claim(lease=0), attempts=5)
+    asyncio.run(queue._retry(claimed, "HTTP 429", retry_after=120))
+    row = store._connection().execute("SELECT next_attempt_at, updated_at FROM submissions").fetchone()
+    assert row[0] - row[1] == pytest.approx(120)
+
+    asyncio.run(queue._retry(dict(claimed, attempts=6), "HTTP 503"))
+    failed = store.get(job["job_id"])
+    assert failed["status"] == "failed" and "gave up after 6 attempts" in failed["error"]
+
+def test_workers_retry_then_accept_and_fail_rejections(store):
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers["Idempotency-Key"])
+        if request.headers["Idempotency-Key"] == "bad":
+            return httpx.Response(400, text="Expected a T1 XML document")
+        if calls.count(request.headers["Idempotency-Key"]) == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"confirmation_number": "ABC"})
+
+    queue = SubmissionQueue(store, "http://netfile.test/submit", workers=2, backoff_base=0.01, poll_interval=0.01,
+                            transport=httpx.MockTransport(handler))
+
+    async def run():
+        await queue.start()
+        try:
+            good, _ = await queue.submit("good", "<?xml version='1.0'?><T1/>")
+            bad, _ = await queue.submit("bad", "nope")
+            for _ in range(200):
+                if {store.get(good["job_id"])["status"], store.get(bad["job_id"])["status"]} <= {"accepted", "failed"}:
+                    break
+                await asyncio.sleep(0.01)
+            return store.get(good["job_id"]), store.get(bad["job_id"])
+        finally:
+            await queue.stop()
+
+    good, bad = asyncio.run(run())
+    assert good["status"] == "accepted" and good["attempts"] == 2
+    assert good["response"] == {"confirmation_number": "ABC"}
+    assert bad["status"] == "failed" and bad["attempts"] == 1
+    # The payload is dropped once accepted
+    assert store._connection().execute("SELECT payload FROM submissions WHERE job_id = ?", (good["job_id"],)).fetchone()[0] is None
+
+def test_old_schema_is_migrated(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE submissions (job_id TEXT PRIMARY KEY, idempotency_key TEXT NOT NULL UNIQUE, status TEXT NOT NULL, "
+        "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL, payload TEXT, response TEXT, error TEXT, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO submissions VALUES ('j1', 'key', 'failed', 8, NULL, '<xml/>', NULL, 'HTTP 503', 1, 1)")
+    conn.commit()
+    conn.close()
+
+    store = SubmissionStore(path)
+    assert store.get("j1")["status"] == "failed"
+    job, created = store.enqueue("key", "<xml/>")
+    assert created and job["job_id"] != "j1"
+
+def test_client_keys_are_scoped_to_the_taxpayer():
+    assert scoped_key({"sin": "046454286"}, "k") != scoped_key({"sin": "000000000"}, "k")
+    assert scoped_key({"sin": "046454286"}, "k") == scoped_key({"sin": "046454286", "first_name": "A"}, "k")
+
+def test_submit_endpoint_scopes_keys_and_refiles_failed_jobs(client):
+    import main
+
+    body = {"tax_year": 2024, "profile": {"sin": "046454286"}, "slips": [{"type": "T4", "boxes": {"14": 50000}}]}
+    other = dict(body, profile={"sin": "000000000"})
+    first = client.post("/api/submit", json=body, headers={"Idempotency-Key": "client-1"})
+    assert first.status_code == 202
+    assert client.post("/api/submit", json=body, headers={"Idempotency-Key": "client-1"}).status_code == 200
+    assert client.post("/api/submit", json=other, headers={"Idempotency-Key": "client-1"}).status_code == 202
+
+    main.submission_queue.store.fail(first.json()["job_id"], "HTTP 400")
+    refiled = client.post("/api/submit", json=body, headers={"Idempotency-Key": "client-1"})
+    assert refiled.status_code == 202
+    assert refiled.json()["job_id"] != first.json()["job_id"]
+
+class FlakyStore(SubmissionStore):
+    """
+    Fails the first `failures` writes of a send's outcome, as a locked
+    database would.
+    """
+
+    def __init__(self, path, failures):
+        super().__init__(path)
+        self.failures = failures
+
+    def _flaky(self):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+
+    def complete(self, job_id, response):
+        self._flaky()
+        super().complete(job_id, response)
+
+    def retry(self, job_id, error, delay):
+        self._flaky()
+        super().retry(job_id, error, delay)
+
+def test_workers_survive_a_failing_store_and_the_lease_brings_the_job_back(tmp_path):
+    # complete() fails, then the retry() recording that failure fails too
+    store = FlakyStore(str(tmp_path / "submissions.db"), failures=2)
+    queue = SubmissionQueue(store, "http://netfile.test/submit", workers=1, timeout=0.05, lease=0.1,
+                            poll_interval=0.01, transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})))
+
+    async def run():
+        await queue.start()
+        try:
+            job, _ = await queue.submit("key", "<T1/>")
+            for _ in range(300):
+                if store.get(job["job_id"])["status"] == "accepted":
+                    break
+                await asyncio.sleep(0.01)
+            assert not any(task.done() for task in queue._tasks)
+            return store.get(job["job_id"])
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(run())
+    assert job["status"] == "accepted" and job["attempts"] == 2
+    assert store.failures == 0